@@ -33,6 +33,19 @@ class Annotation(object):
         duplicate.format_kwargs = format_kwargs
         return duplicate
 
+    def detach(self):
+        """
+        Return a copy with the message already formatted. The copy does not
+        reference the format arguments anymore, which are often nodes of the
+        document. So it can be stored between builds.
+        """
+        message = self.get_message()
+        message = message.replace(u'{', u'{{').replace(u'}', u'}}')
+        return self.__class__(
+            message,
+            level=self.level,
+            title_text=self.title_text)
+
     def get_message(self):
         return self.message.format(
             *self.format_args,
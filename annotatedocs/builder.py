@@ -1,13 +1,42 @@
-import json
+import os
+import time
+from multiprocessing import Pool
 
 import sphinx_rtd_theme
 from sphinx.application import Sphinx
 from sphinx.writers.html import HTMLTranslator
 from sphinx.builders.html import StandaloneHTMLBuilder
-from sphinx.util.console import darkgreen
+from sphinx.util.console import bold, darkgreen
 
-from . import bundles
+from . import __version__, bundles
+from .cache import ResultCache
 from .document import DocumentStructure
+from .incremental import AnalysisStore
+from .messages import MessageTable
+
+
+class DocumentAnnotations(object):
+    '''
+    The annotations of a single document, already turned into the lists of
+    references to the ``MessageTable`` that end up in the HTML. The
+    annotations of the nodes are looked up by the identity of the docutils
+    node.
+
+    They are prepared once in the main process. The writer processes only
+    look up the strings and do not touch the document structure.
+    '''
+
+    def __init__(self, document, message_table):
+        self.document_annotations = message_table.dump_refs(
+            document.get_document_annotations())
+        nodes = document.data.nodes
+        self.node_annotations = dict(
+            (id(nodes[node.node_id]),
+             message_table.dump_refs(node.annotations))
+            for node in document.nodeset.filter(annotations__exists=True))
+
+    def get(self, node):
+        return self.node_annotations.get(id(node))
 
 
 class AnnotatedHTMLTranslator(HTMLTranslator):
@@ -19,35 +48,27 @@ class AnnotatedHTMLTranslator(HTMLTranslator):
         docname = builder.docnames_by_doctree.get(document, None)
         if docname:
             self.annotate = True
-            self.document_structure = builder.document_structure
-            self.document_data = self.document_structure.get_document(docname)
+            self.annotations = builder.document_annotations[docname]
             self._document_annotations_set = False
         else:
             self.annotate = False
 
-    def apply_annotation_attribute(self, attributes, attribute, annotations):
-        if annotations:
-            json_data = json.dumps([
-                annotation.serialize()
-                for annotation in annotations])
-            attributes[attribute] = json_data
+    def apply_annotation_attribute(self, attributes, attribute, refs):
+        if refs:
+            attributes[attribute] = refs
 
     def has_set_document_annotations(self):
         return self._document_annotations_set
 
     def set_document_annotations(self, attributes):
         """
-        Set the document annotations to the given node.
+        Set the document annotations to the given node. The global
+        annotations are part of the message table.
         """
-        self.apply_annotation_attribute(
-            attributes,
-            'data-global-annotations',
-            self.document_structure.get_global_annotations())
-
         self.apply_annotation_attribute(
             attributes,
             'data-document-annotations',
-            self.document_data.get_document_annotations())
+            self.annotations.document_annotations)
 
         self._document_annotations_set = True
 
@@ -60,7 +81,7 @@ class AnnotatedHTMLTranslator(HTMLTranslator):
         self.apply_annotation_attribute(
             attributes,
             'data-annotations',
-            self.document_data[node].annotations)
+            self.annotations.get(node))
 
         return attributes
 
@@ -71,13 +92,70 @@ class AnnotatedHTMLTranslator(HTMLTranslator):
                                        empty=empty, **attributes)
 
 
+# The builder that the forked writer processes use.
+_writer = None
+
+
+def write_documents(docnames):
+    '''
+    Write the given documents with the builder of the main process. Runs in
+    the writer processes and returns the warnings of the documents.
+    '''
+    warnings = []
+    _writer.env.set_warnfunc(lambda *args: warnings.append(args))
+    for docname in docnames:
+        _writer.write_doc(docname, _writer.doctrees_by_docname[docname])
+    return warnings
+
+
 class AnnotatedHTMLBuilder(StandaloneHTMLBuilder):
     allow_parallel = False
+    chunks_per_job = 4
+
+    # The file in the doctrees directory that keeps the analysis between
+    # incremental builds.
+    analysis_store_filename = 'annotatedocs-analysis.pickle'
+
+    # The file in the output directory that holds the annotation messages of
+    # all pages.
+    message_table_filename = os.path.join('_static', 'annotations.js')
 
     def init_translator_class(self):
         self.translator_class = AnnotatedHTMLTranslator
 
-    def _write_serial(self, docnames, warnings):
+    def get_analysis_store(self):
+        '''
+        Return the ``AnalysisStore`` for incremental builds or ``None`` if
+        all documents are analyzed on every build.
+        '''
+        if not self.app.incremental:
+            return None
+        if not hasattr(self, '_analysis_store'):
+            self._analysis_store = AnalysisStore(
+                os.path.join(self.doctreedir, self.analysis_store_filename),
+                fingerprint=self.get_analysis_fingerprint())
+        return self._analysis_store
+
+    def get_analysis_fingerprint(self):
+        bundle_conf = getattr(
+            self.app.config,
+            'annotatedocs_bundle',
+            self.app.bundle_override)
+        if not isinstance(bundle_conf, basestring):
+            bundle_conf = repr(bundle_conf)
+        return (__version__, bundle_conf)
+
+    def get_outdated_docs(self):
+        store = self.get_analysis_store()
+        if store is not None and not store.is_fresh:
+            return 'documents without stored analysis'
+        return super(AnnotatedHTMLBuilder, self).get_outdated_docs()
+
+    def gather_annotation_data(self, docnames):
+        '''
+        Resolve the doctrees and analyze them. Returns the names of the
+        documents that shall be written.
+        '''
         doctrees_by_docname = {}
         for docname in self.status_iterator(
                 docnames,
@@ -88,13 +166,165 @@ class AnnotatedHTMLBuilder(StandaloneHTMLBuilder):
             doctrees_by_docname[docname] = doctree
         self.prepare_annotation_data(doctrees_by_docname)
 
+        # Incremental builds might need to write other documents as well.
+        return sorted(self.doctrees_by_docname)
+
+    def init_message_table(self, docnames):
+        '''
+        Create the message table for the build. The table of the previous
+        build is kept if not all documents are written, as the pages that
+        are not written again reference its messages.
+        '''
+        path = os.path.join(self.outdir, self.message_table_filename)
+        if set(self.env.found_docs) - set(docnames):
+            self.message_table = MessageTable.load(path)
+        else:
+            self.message_table = MessageTable()
+        # Changes the URL of the table for the pages written in this build,
+        # so that browsers do not use a cached table that misses messages.
+        self.message_table_version = str(int(time.time()))
+
+    def get_message_table(self):
+        if getattr(self, 'message_table', None) is None:
+            self.init_message_table(self.env.found_docs)
+        return self.message_table
+
+    def finish(self):
+        super(AnnotatedHTMLBuilder, self).finish()
+        table = getattr(self, 'message_table', None)
+        if table is not None:
+            self.info(bold('writing annotation messages... '), nonl=True)
+            table.save(os.path.join(self.outdir, self.message_table_filename))
+            self.info('done')
+
+    def _write_serial(self, docnames, warnings):
+        self.init_message_table(docnames)
+        if self.app.streaming:
+            self.write_streaming(docnames, warnings)
+            return
+        docnames = self.gather_annotation_data(docnames)
+        if self.app.jobs > 1 and len(docnames) > 1:
+            self.write_parallel(docnames, warnings)
+        else:
+            for docname in self.status_iterator(
+                    docnames, 'writing output... ', darkgreen, len(docnames)):
+                doctree = self.doctrees_by_docname[docname]
+                self.write_doc_serialized(docname, doctree)
+                self.write_doc(docname, doctree)
+        for warning in warnings:
+            self.warn(*warning)
+
+    def write_parallel(self, docnames, warnings):
+        '''
+        Write the documents in forked worker processes. The analysis is done
+        once in this process, the workers get the doctrees and their prepared
+        annotations with the forked memory. Only the names of the documents
+        and the warnings are sent between the processes.
+        '''
+        global _writer
+
+        # Warm up caches and compile the templates with the first document.
+        firstname, docnames = docnames[0], docnames[1:]
+        doctree = self.doctrees_by_docname[firstname]
+        self.write_doc_serialized(firstname, doctree)
+        self.write_doc(firstname, doctree)
+
+        # The parts of writing that are not safe to run in parallel, like
+        # collecting the images and the search index, stay in this process.
+        for docname in docnames:
+            self.write_doc_serialized(
+                docname, self.doctrees_by_docname[docname])
+
+        jobs = self.app.jobs
+        chunk_count = jobs * self.chunks_per_job
+        chunk_size = (len(docnames) + chunk_count - 1) // chunk_count
+        chunks = [
+            docnames[start:start + chunk_size]
+            for start in xrange(0, len(docnames), chunk_size)]
+
+        _writer = self
+        pool = Pool(processes=jobs)
+        try:
+            results = pool.imap(write_documents, chunks)
+            for chunk in self.status_iterator(
+                    chunks, 'writing output... ', darkgreen, len(chunks)):
+                warnings.extend(next(results))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _writer = None
+
+    def write_streaming(self, docnames, warnings):
+        '''
+        Write the documents in two passes that only hold a single document in
+        memory at a time.
+
+        The first pass analyzes every document on its own and only keeps a
+        summary of the results in an ``AnalysisStore``: the annotations of
+        the nodes, the page types and the global annotations. The second pass
+        restores the analysis of every document from that summary, writes it
+        and releases it again.
+
+        Every document is analyzed in a ``DocumentStructure`` of its own, so
+        no data across documents is computed. Checks therefore cannot look at
+        other documents, except through the global annotations, and checks
+        that need data of several documents do not work in this mode.
+        '''
+        bundle = self.get_bundle()
+        store = self.get_analysis_store()
+        if store is None:
+            store = AnalysisStore()
+        previous_annotations = [
+            annotation.serialize()
+            for annotation in store.get_global_annotations()]
+        store.remove_missing(self.env.found_docs)
+
+        cache = self.get_result_cache()
+        try:
+            for docname in self.status_iterator(
+                    docnames,
+                    'analyzing documents... ',
+                    darkgreen,
+                    len(docnames)):
+                structure = DocumentStructure(None, bundle=bundle, cache=cache)
+                doctree = self.env.get_and_resolve_doctree(docname, self)
+                document = structure.add_document(docname, doctree)
+                structure.analyze()
+                store.add_document(document)
+        finally:
+            if cache is not None:
+                cache.close()
+        store.save()
+
+        global_annotations = store.get_global_annotations()
+        if [annotation.serialize()
+                for annotation in global_annotations] != previous_annotations:
+            # Every page shows the global annotations, so all pages of an
+            # incremental build need to be written again.
+            docnames = sorted(self.env.found_docs)
+
         for docname in self.status_iterator(
                 docnames, 'writing output... ', darkgreen, len(docnames)):
-            doctree = doctrees_by_docname[docname]
+            doctree = self.env.get_and_resolve_doctree(docname, self)
+            self.doctrees_by_docname = {docname: doctree}
+            self.docnames_by_doctree = {doctree: docname}
+            self.document_structure = DocumentStructure(None, bundle=bundle)
+            self.document_structure.global_annotations = list(
+                global_annotations)
+            document = self.document_structure.add_document(docname, doctree)
+            if not store.restore_document(document):
+                self.document_structure.analyze()
+            self.prepare_document_annotations()
             self.write_doc_serialized(docname, doctree)
             self.write_doc(docname, doctree)
-        for warning in warnings:
-            self.warn(*warning)
+
+        self.doctrees_by_docname = {}
+        self.docnames_by_doctree = {}
+        self.document_structure = None
+        self.document_annotations = {}
 
     def get_bundle(self):
         # The config will only be set if 'annotatedocs' is listed as an
@@ -138,11 +368,79 @@ class AnnotatedHTMLBuilder(StandaloneHTMLBuilder):
             (doctree, docname)
             for docname, doctree in doctrees_by_docname.items())
 
+        cache = self.get_result_cache()
         self.document_structure = DocumentStructure(self.doctrees_by_docname,
-                                                    bundle=self.get_bundle())
+                                                    bundle=self.get_bundle(),
+                                                    jobs=self.app.jobs,
+                                                    cache=cache)
         # Kick off the analyzing step. This includes finding the page types and
         # checking the relevant nodes for flaws.
-        self.document_structure.analyze()
+        try:
+            self.document_structure.analyze()
+        finally:
+            if cache is not None:
+                cache.close()
+                self.document_structure.cache = None
+
+        store = self.get_analysis_store()
+        if store is not None:
+            self.update_analysis_store(store)
+
+        self.prepare_document_annotations()
+
+    def prepare_document_annotations(self):
+        table = self.get_message_table()
+        table.set_global_annotations(
+            self.document_structure.get_global_annotations())
+        self.document_annotations = dict(
+            (docname, DocumentAnnotations(document, table))
+            for docname, document in
+            self.document_structure.documents.items())
+
+    def get_result_cache(self):
+        if self.app.cache_file:
+            return ResultCache(self.app.cache_file)
+        return None
+
+    def add_doctree(self, docname, doctree):
+        self.doctrees_by_docname[docname] = doctree
+        self.docnames_by_doctree[doctree] = docname
+        return self.document_structure.add_document(docname, doctree)
+
+    def update_analysis_store(self, store):
+        '''
+        Keep the analysis of the documents that are written in this build.
+
+        Every page shows the global annotations. If they changed, all other
+        documents need to be written again as well. Their annotations are
+        restored from the store instead of analyzing them again.
+        '''
+        previous_annotations = [
+            annotation.serialize()
+            for annotation in store.get_global_annotations()]
+        store.remove_missing(self.env.found_docs)
+        for document in self.document_structure.documents.values():
+            store.add_document(document)
+
+        global_annotations = store.get_global_annotations()
+        if [annotation.serialize()
+                for annotation in global_annotations] != previous_annotations:
+            other_docnames = sorted(
+                set(self.env.found_docs) - set(self.doctrees_by_docname))
+            for docname in self.status_iterator(
+                    other_docnames,
+                    'restoring annotation data... ',
+                    darkgreen,
+                    len(other_docnames)):
+                doctree = self.env.get_and_resolve_doctree(docname, self)
+                document = self.add_doctree(docname, doctree)
+                if not store.restore_document(document):
+                    self.document_structure.analyze()
+                    store.add_document(document)
+            global_annotations = store.get_global_annotations()
+
+        self.document_structure.global_annotations = global_annotations
+        store.save()
 
     def get_doc_context(self, docname, body, metatags):
         context = super(AnnotatedHTMLBuilder, self).get_doc_context(docname, body, metatags)
@@ -151,12 +449,21 @@ class AnnotatedHTMLBuilder(StandaloneHTMLBuilder):
         context['document'] = document
         context['page_types'] = document.page_types
         context['checks'] = document.applied_checks
+        context['annotation_messages_version'] = self.message_table_version
         return context
 
 
 class AnnotatedSphinx(Sphinx):
     def __init__(self, *args, **kwargs):
         confoverrides = kwargs.pop('confoverrides', {})
+        # The number of processes that analyze the documents.
+        self.jobs = kwargs.pop('jobs', 1)
+        # Metric results are cached in this file if it is given.
+        self.cache_file = kwargs.pop('cache_file', None)
+        # Only analyze the documents that changed since the last build.
+        self.incremental = kwargs.pop('incremental', False)
+        # Analyze and write one document at a time to bound the memory usage.
+        self.streaming = kwargs.pop('streaming', False)
         self.bundle_override = confoverrides.get('annotatedocs_bundle', None)
 
         # TODO: We force the 'annotatedocs' theme here. We should change the
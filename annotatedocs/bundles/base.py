@@ -1,4 +1,7 @@
-from ..utils import instantiate
+import re
+
+from ..metrics import MetricGraph
+from ..utils import instantiate, normalize_document_path
 
 
 __all__ = ('Bundle',)
@@ -16,6 +19,15 @@ class Bundle(object):
         annotatedocs_bundle = 'myproject.docchecks.project_bundle'
 
     TODO: Implement the conf.py support.
+
+    The bundle builds the dependency graph of all metrics that its page types
+    and their checks require when it is created. So circular dependencies
+    between the metrics are already reported when the bundle is loaded.
+
+    The ``path_patterns`` of all page types are compiled into combined regular
+    expressions. ``get_path_scores()`` uses them to classify the names of all
+    documents at once, so only the page types that look at the content of a
+    document need their metrics.
     """
 
     fallback_page_types = None
@@ -40,6 +52,10 @@ class Bundle(object):
             raise TypeError(
                 u'Unexpected keyword arguments: {}'.format(', '.join(kwargs)))
 
+        self._metric_graph = None
+        self._path_matchers = None
+        self.get_metric_graph()
+
     def get_fallback_page_types(self, use_fallback=True):
         # We see if there was a ``fallback_page_types`` argument passed to the
         # constructor.
@@ -68,8 +84,99 @@ class Bundle(object):
             page_types.update(bundle.get_page_types())
         return page_types
 
+    def get_metric_graph(self):
+        """
+        Return the ``MetricGraph`` of the metrics that the page types and
+        their checks require.
+        """
+        if self._metric_graph is None:
+            graph = MetricGraph()
+            page_types = (
+                list(self.get_page_types()) +
+                [instantiate(page_type)
+                 for page_type in self.get_fallback_page_types()])
+            for page_type in page_types:
+                graph.add_all(page_type.required_metrics)
+                for check in page_type.checks:
+                    graph.add_all(check.required_metrics)
+            self._metric_graph = graph
+        return self._metric_graph
+
+    def get_path_page_types(self):
+        return [
+            page_type
+            for page_type in self.get_page_types()
+            if page_type.matches_path_only()]
+
+    def get_path_matchers(self):
+        """
+        Return a list of ``(regex, page_types)`` tuples. The regex is found in
+        a normalized document path if any pattern of the page types is found.
+
+        The patterns are combined into one regex for every set of regex
+        flags. Patterns that cannot be combined, e.g. because they use the
+        same group names, are kept as separate regexes.
+        """
+        if self._path_matchers is None:
+            patterns_by_flags = {}
+            for page_type in self.get_path_page_types():
+                for regex, score in page_type.get_path_patterns():
+                    patterns_by_flags.setdefault(regex.flags, []).append(
+                        (regex, page_type))
+
+            matchers = []
+            for flags, patterns in sorted(patterns_by_flags.items()):
+                page_types = []
+                for regex, page_type in patterns:
+                    if page_type not in page_types:
+                        page_types.append(page_type)
+                # A verbose pattern might end with a comment.
+                end = '\n' if flags & re.VERBOSE else ''
+                try:
+                    combined = re.compile(
+                        '|'.join(
+                            '(?:{}{})'.format(regex.pattern, end)
+                            for regex, page_type in patterns),
+                        flags)
+                # Python's re module raises an AssertionError if there are
+                # more than 100 groups in a regex.
+                except (re.error, AssertionError):
+                    matchers.extend(
+                        (regex, [page_type])
+                        for regex, page_type in patterns)
+                else:
+                    matchers.append((combined, page_types))
+            self._path_matchers = matchers
+        return self._path_matchers
+
+    def get_path_scores(self, names):
+        """
+        Classify the documents with the given names by the ``path_patterns``
+        of the page types. Return a dict that maps every name to a dict of
+        the page types and their match.
+        """
+        matchers = self.get_path_matchers()
+        page_types = self.get_path_page_types()
+        scores = {}
+        for name in names:
+            path = normalize_document_path(name)
+            document_scores = dict.fromkeys(page_types, 0)
+            if path is not None:
+                for regex, candidates in matchers:
+                    if regex.search(path):
+                        for page_type in candidates:
+                            document_scores[page_type] = (
+                                page_type.match_path(path))
+            scores[name] = document_scores
+        return scores
+
     def get_page_type_match(self, page_type, document):
-        document.apply_metrics(page_type.get_required_metrics())
+        path_scores = document.path_scores
+        if path_scores is not None and page_type in path_scores:
+            return path_scores[page_type]
+        # Page types often only look at the document's name. So their
+        # metrics are only applied once the match accesses their results.
+        document.require_metrics(page_type.required_metrics)
         return page_type.match(document=document)
 
     def should_select_page_type(self, page_type, document, match):
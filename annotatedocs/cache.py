@@ -0,0 +1,128 @@
+import cPickle as pickle
+import hashlib
+import sqlite3
+import time
+
+from logbook import Logger
+
+
+__all__ = ('ResultCache', 'hash_text')
+
+
+log = Logger(__name__)
+
+
+def hash_text(text):
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return hashlib.sha1(text).hexdigest()
+
+
+class ResultCache(object):
+    '''
+    A persistent cache for the results that metrics computed from the text of
+    a node. It is stored in a single sqlite file.
+
+    The results are keyed by the metric's id, the metric's version and the
+    hash of the text. So changing the text or bumping the version of a metric
+    computes the result again.
+
+    The cache holds up to ``max_size`` bytes of pickled results. The results
+    that were not used for the longest time are removed first once the cache
+    grows above that.
+    '''
+
+    default_max_size = 256 * 1024 * 1024
+
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size or self.default_max_size
+        self.connection = sqlite3.connect(path)
+        self.connection.text_factory = str
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                metric_id TEXT NOT NULL,
+                version TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (metric_id, version, text_hash)
+            )''')
+        self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS results_last_used
+            ON results (last_used)''')
+        self.connection.commit()
+
+    def get_many(self, metric_id, version, text_hashes):
+        '''
+        Return a dict that maps the given text hashes to the cached results.
+        Hashes without a cached result are left out.
+        '''
+        version = str(version)
+        found = {}
+        for text_hash in set(text_hashes):
+            row = self.connection.execute(
+                'SELECT value FROM results '
+                'WHERE metric_id = ? AND version = ? AND text_hash = ?',
+                (metric_id, version, text_hash)).fetchone()
+            if row is not None:
+                found[text_hash] = pickle.loads(str(row[0]))
+
+        self.connection.executemany(
+            'UPDATE results SET last_used = ? '
+            'WHERE metric_id = ? AND version = ? AND text_hash = ?',
+            [(time.time(), metric_id, version, text_hash)
+             for text_hash in found])
+        self.connection.commit()
+        return found
+
+    def set_many(self, metric_id, version, results):
+        '''
+        Store the results given as dict that maps the text hash to the
+        result.
+        '''
+        version = str(version)
+        now = time.time()
+        rows = []
+        for text_hash, value in results.items():
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            rows.append((
+                metric_id, version, text_hash, sqlite3.Binary(value),
+                len(value), now))
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO results '
+            '(metric_id, version, text_hash, value, size, last_used) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            rows)
+        self.connection.commit()
+        self.evict()
+
+    def get_size(self):
+        size, = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()
+        return size
+
+    def evict(self):
+        '''
+        Remove the least recently used results until the cache is not larger
+        than ``max_size`` anymore.
+        '''
+        excess = self.get_size() - self.max_size
+        if excess <= 0:
+            return
+        rowids = []
+        rows = self.connection.execute(
+            'SELECT rowid, size FROM results ORDER BY last_used').fetchall()
+        for rowid, size in rows:
+            if excess <= 0:
+                break
+            rowids.append((rowid,))
+            excess -= size
+        log.debug('Evicting {} results from {}'.format(len(rowids), self.path))
+        self.connection.executemany(
+            'DELETE FROM results WHERE rowid = ?', rowids)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
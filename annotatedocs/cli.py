@@ -24,10 +24,26 @@ from .loader import get_loader
                   'downloaded.'))
 @click.option('-r', '--recreate/--no-recreate', is_flag=True,
               help='Recreate all cached files.')
+@click.option('-j', '--jobs', type=int, default=1,
+              help=(
+                  'Number of worker processes that analyze the documents. '
+                  'Defaults to 1.'))
+@click.option('-i', '--incremental/--no-incremental', is_flag=True,
+              help=(
+                  'Only analyze and write the documents that changed since '
+                  'the last build.'))
+@click.option('-s', '--streaming/--no-streaming', is_flag=True,
+              help=(
+                  'Analyze and write one document at a time. This bounds the '
+                  'memory usage by the largest document. Documents are '
+                  'written by a single process. Every document is analyzed '
+                  'on its own, so checks that need data of other documents '
+                  'do not work in this mode.'))
 @click.option('--debug/--no-debug', is_flag=True, help='Show debug output.')
 @click.option('-w', is_flag=True,
               help='Open the build documentation in your default webbrowser.')
-def main(docs, bundle, build_dir, tmp_dir, recreate, debug, w):
+def main(docs, bundle, build_dir, tmp_dir, recreate, jobs, incremental,
+         streaming, debug, w):
     '''
     annotatedocs analyzes your sphinx-based documentation and provides helpful
     feedback about the quality and possible improvements.
@@ -65,7 +81,10 @@ def main(docs, bundle, build_dir, tmp_dir, recreate, debug, w):
             confoverrides = {}
             if bundle:
                 confoverrides['annotatedocs_bundle'] = bundle
-            index_file = loader.build(confoverrides=confoverrides)
+            index_file = loader.build(confoverrides=confoverrides,
+                                      jobs=jobs,
+                                      incremental=incremental,
+                                      streaming=streaming)
 
             if w:
                 webbrowser.open(index_file)
@@ -7,18 +7,26 @@ __all__ = ('HasNoLongSections',)
 
 @metrics.require(TextStats)
 class SectionWordCount(Metric):
+    """
+    Sets ``'section_word_count'`` on every section to the number of words in
+    the section, not counting the words of its subsections.
+    """
+
     def limit(self, nodeset):
         return nodeset.filter(type='section')
 
-    def apply(self, node, document):
-        # TODO: Querying does not work reliably yet. It counts words for
-        # subsections as well I think.
+    def apply_to_document(self, document):
+        sections = self.limit(document.nodeset)
+        # The word counts of all sections are summed up in one pass over the
+        # tree. The words of subsections are not counted again for the parent
+        # section.
+        word_counts = document.nodeset.aggregate(
+            'word_count', 'sum', group_by='section')
 
-        nodeset = node.nodeset.filter(word_count__exists=True)
-        for textnode in nodeset:
+        for textnode in sections.subset().filter(word_count__exists=True):
             textnode.annotate(Hint('Words: {}'.format(textnode['word_count'])))
-        word_counts = nodeset.values_list('word_count', flat=True)
-        node['section_word_count'] = sum(word_counts)
+        for section in sections:
+            section['section_word_count'] = word_counts[section]
 
 
 @metrics.require(SectionWordCount)
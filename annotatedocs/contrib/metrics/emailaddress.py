@@ -11,6 +11,8 @@ class EmailAddress(Metric):
     Adds the ``'email_address'`` key to a node if it is a ``mailto:`` URI.
     """
 
+    provides = ('email_address',)
+
     def limit(self, nodeset):
         return nodeset.filter(uri_scheme='mailto', uri_path__exists=True)
 
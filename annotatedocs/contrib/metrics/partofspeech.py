@@ -1,15 +1,28 @@
-from ... import metrics, Metric, NodeType
-from ..nlp import get_pos_tags
+from ... import metrics, NodeType, TextMetric
+from ..nlp import tag_tokenized_text
+from .tokens import Tokens
 
 
 __all__ = ('PartOfSpeech',)
 
 
-@metrics.require(NodeType)
-class PartOfSpeech(Metric):
+@metrics.require(NodeType, Tokens)
+class PartOfSpeech(TextMetric):
+    '''
+    Tags the words of every paragraph with their part of speech.
+    '''
+
+    compute = staticmethod(tag_tokenized_text)
+    cache_version = '2'
+    provides = ('part_of_speech_tags',)
+
     def limit(self, nodeset):
-        return nodeset.filter(type='paragraph')
+        return nodeset.filter(type='paragraph', tokens__exists=True)
+
+    def get_text(self, node):
+        # The tagger gets the tokens of the ``Tokens`` metric, so the text is
+        # not tokenized again.
+        return node['tokens'].get_tagger_input()
 
-    def apply(self, node, document):
-        raw_node = node.node
-        node['part_of_speech_tags'] = get_pos_tags(raw_node.astext())
+    def store(self, node, tags):
+        node['part_of_speech_tags'] = tags
@@ -8,6 +8,8 @@ __all__ = ('PassiveVoicePhrases',)
 
 @metrics.require(PartOfSpeech)
 class PassiveVoicePhrases(Metric):
+    provides = ('passive_voice_phrases',)
+
     def limit(self, nodeset):
         return nodeset.filter(type='paragraph',
                               part_of_speech_tags__exists=True)
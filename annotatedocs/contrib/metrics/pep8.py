@@ -1,7 +1,8 @@
 from __future__ import absolute_import
 import pep8
 
-from ... import Metric, NodeType, metrics
+from ... import NodeType, TextMetric, metrics
+from ...utils import lru_cache
 
 
 __all__ = ('PEP8Metric',)
@@ -22,8 +23,35 @@ class MetricReport(pep8.BaseReport):
         super(MetricReport, self).error(line_number, offset, text, check)
 
 
+@lru_cache(maxsize=1)
+def get_options():
+    '''
+    Return the pep8 options. Creating a ``StyleGuide`` parses the command
+    line and the config files, so it is only done once per process.
+    '''
+    return pep8.StyleGuide(quiet=True).options
+
+
+def check_code(code, report_class=MetricReport):
+    '''
+    Return the pep8 errors and warnings of ``code``, sorted by line. The
+    list is empty if pep8 does not report an error for the code.
+    '''
+    # We need to add newlines to the end of each line. That is what the
+    # pep8 checker is expecting.
+    lines = [line + '\n' for line in code.splitlines()]
+    options = get_options()
+    checker = pep8.Checker(
+        lines=lines,
+        options=options,
+        report=report_class(options))
+    if not checker.check_all():
+        return []
+    return sorted(checker.report.errors, key=lambda e: e['line_number'])
+
+
 @metrics.require(NodeType)
-class PEP8Metric(Metric):
+class PEP8Metric(TextMetric):
     """
     Will add pep8 error and warnings to the node.
 
@@ -43,26 +71,13 @@ class PEP8Metric(Metric):
         The error/warning message as text.
     """
 
-    report_class = MetricReport
+    compute = staticmethod(check_code)
+    cache_version = '1'
+    provides = ('pep8_errors',)
 
     def limit(self, nodeset):
         return nodeset.filter(type='literal_block', language='python')
 
-    def get_report(self):
-        options = pep8.StyleGuide(quiet=True).options
-        return self.report_class(options)
-
-    def apply(self, node, document):
-        code = node.astext()
-
-        # We need to add newlines to the end of each line. That is what the
-        # pep8 checker is expecting.
-        lines = [line + '\n' for line in code.splitlines()]
-        checker = pep8.Checker(
-            lines=lines,
-            report=self.get_report())
-        file_errors = checker.check_all()
-        if file_errors:
-            errors = sorted(checker.report.errors,
-                            key=lambda e: e['line_number'])
+    def store(self, node, errors):
+        if errors:
             node['pep8_errors'] = errors
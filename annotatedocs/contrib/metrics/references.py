@@ -17,6 +17,22 @@ class References(Metric):
     ``is_external_ref`` is ``True`` if it's a link to a external resource, e.g.
     a website.
     """
+    provides = (
+        'refuri',
+        'uri_scheme',
+        'uri_netloc',
+        'uri_path',
+        'uri_params',
+        'uri_query',
+        'uri_fragment',
+        'uri_username',
+        'uri_password',
+        'uri_hostname',
+        'uri_port',
+        'is_internal_ref',
+        'is_external_ref',
+    )
+
     def limit(self, nodeset):
         return nodeset.filter(type='reference')
 
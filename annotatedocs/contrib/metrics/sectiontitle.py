@@ -1,5 +1,5 @@
 from ...metrics import Metric, NodeType, require
-from .stemmer import Stemmer
+from .stemmer import Stemmer, stem_keywords
 
 
 __all__ = ('SectionTitle',)
@@ -12,15 +12,15 @@ class SectionTitle(Metric):
     the title for this section.
     """
 
+    provides = ('title', 'is_section_title', 'section')
+
     def limit(self, nodeset):
         return nodeset.filter(type='section')
 
     def apply(self, node, document):
-        titles = node.nodeset.filter(type='title')
-        # Check that the title is the actual title for this section and not
-        # deeply nested.
-        titles = titles.filter(lambda n: n.parent is node)
-        title = titles.first()
+        # Only look at the direct children, so that we get the actual title
+        # for this section and not the one of a nested section.
+        title = node.nodeset.children().filter(type='title').first()
         if title:
             node['title'] = title
             title['is_section_title'] = True
@@ -45,22 +45,40 @@ class SectionTitleContainsKeywords(Metric):
         self.flag_name = flag_name or self.flag_name
         self.keywords = keywords or self.keywords
         super(SectionTitleContainsKeywords, self).__init__(*args, **kwargs)
-        self.stemmed_keywords = set(Stemmer.stem(' '.join(self.keywords)))
         assert self.flag_name, "`flag_name` attribute is not set."
+        self.provides = (self.flag_name,)
+
+    def get_id(self):
+        """
+        Sections are flagged for every combination of flag name and keywords,
+        also if they are set as class attributes.
+        """
+        return '{}({!r}, {!r})'.format(
+            '.'.join((self.__module__, self.__class__.__name__)),
+            self.flag_name,
+            sorted(self.keywords))
 
-    def title_contains_keyword(self, node):
-        title = node['title']
-        for word in title['stemmed_words']:
-            if word in self.stemmed_keywords:
-                return True
+    @property
+    def stemmed_keywords(self):
+        # Stemming is deferred until the metric is applied. The bundle
+        # already creates an instance to find out the id of the metric.
+        return stem_keywords(tuple(self.keywords))
 
     def limit(self, nodeset):
         """
         Only return sections with a title that contains a keyword that
         indicates that this is a section that talks about dependencies.
         """
+        # The titles are looked up in the index of the stemmed words.
+        title_ids = set(
+            title.node_id
+            for stem in self.stemmed_keywords
+            for title in nodeset.filter(
+                stemmed_words__contains=stem,
+                is_section_title=True))
         nodeset = nodeset.filter(type='section', title__exists=True)
-        return nodeset.filter(self.title_contains_keyword)
+        return nodeset.filter(
+            lambda node: node['title'].node_id in title_ids)
 
     def apply(self, node, document):
         node[self.flag_name] = True
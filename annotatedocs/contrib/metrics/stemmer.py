@@ -1,26 +1,46 @@
-from textblob import TextBlob
-
 from ... import Metric, NodeType, metrics
+from ...utils import lru_cache
 from .. import nlp
+from .tokens import Tokens
+
+
+__all__ = ('Stemmer', 'stem_keywords')
 
 
-__all__ = ('Stemmer',)
+@lru_cache(maxsize=256)
+def stem_keywords(keywords):
+    '''
+    Return the set of stems of the ``keywords`` tuple. Metrics and checks
+    that look for keywords in the stemmed words use this, so that their
+    keywords are only stemmed once.
+    '''
+    return frozenset(Stemmer.stem(u' '.join(keywords)))
 
 
-@metrics.require(NodeType)
+@metrics.require(NodeType, Tokens)
 class Stemmer(Metric):
+    '''
+    Adds the stems of the words of the node as ``'stemmed_words'``. The
+    document indexes the nodes by their stems, so
+    ``nodeset.filter(stemmed_words__contains=stem)`` is an index lookup.
+    '''
+
     stem_word = staticmethod(nlp.stem_word)
-    word_tokenizer = staticmethod(lambda text: TextBlob(text).words)
+    provides = ('stemmed_words',)
+    inverted_keys = ('stemmed_words',)
 
     def limit(self, nodeset):
-        return nodeset.filter(is_content_type=True)
+        return nodeset.filter(is_content_type=True, tokens__exists=True)
 
     @classmethod
     def stem(cls, text):
-        for word in cls.word_tokenizer(text):
+        return cls.stem_words(nlp.get_words(text))
+
+    @classmethod
+    def stem_words(cls, words):
+        for word in words:
             yield cls.stem_word(word)
 
     def apply(self, node, document):
-        stemmed_words = node.setdefault('stemmed_words', [])
-        stemmed_text = self.stem(node.node.astext())
-        stemmed_words.extend(stemmed_text)
+        stemmed_words = self.stem_words(node['tokens'].get_words())
+        node.setdefault('stemmed_words', []).extend(stemmed_words)
@@ -1,32 +1,35 @@
 from __future__ import division
 
-import nltk
-
 from ... import Metric, NodeType, metrics
+from .tokens import Tokens
 
 
 __all__ = ('TextStats',)
 
 
-@metrics.require(NodeType)
+def get_text_stats(tokens):
+    word_count = len(tokens)
+    sentence_count = len(tokens.sentence_ends)
+
+    return {
+        'char_count': tokens.char_count,
+        'word_count': word_count,
+        'sentence_count': sentence_count,
+        'avg_sentence_length': word_count / sentence_count,
+    }
+
+
+@metrics.require(NodeType, Tokens)
 class TextStats(Metric):
     '''
     Adds some statistics like average word length, sentence length etc.
     '''
 
+    provides = (
+        'char_count', 'word_count', 'sentence_count', 'avg_sentence_length')
+
     def limit(self, nodeset):
-        return nodeset.filter(is_content_type=True)
+        return nodeset.filter(is_content_type=True, tokens__exists=True)
 
     def apply(self, node, document):
-        text = node.node.astext()
-        sentences = [
-            nltk.word_tokenize(sentence)
-            for sentence in nltk.sent_tokenize(text)]
-
-        word_count = sum([len(sentence) for sentence in sentences])
-        sentence_count = len(sentences)
-
-        node['char_count'] = len(text)
-        node['word_count'] = word_count
-        node['sentence_count'] = sentence_count
-        node['avg_sentence_length'] = word_count / sentence_count
+        node.update(get_text_stats(node['tokens']))
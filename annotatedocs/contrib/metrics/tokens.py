@@ -0,0 +1,25 @@
+from ... import NodeType, TextMetric, metrics
+from .. import nlp
+
+
+__all__ = ('Tokens',)
+
+
+@metrics.require(NodeType)
+class Tokens(TextMetric):
+    '''
+    Splits the text of every content node into sentences and tokens once, so
+    that the other NLP metrics do not need to tokenize the text again.
+
+    ``node['tokens']`` is a ``annotatedocs.contrib.nlp.TokenizedText``.
+    '''
+
+    compute = staticmethod(nlp.tokenize)
+    cache_version = '1'
+    provides = ('tokens',)
+
+    def limit(self, nodeset):
+        return nodeset.filter(is_content_type=True)
+
+    def store(self, node, tokens):
+        node['tokens'] = tokens
@@ -16,6 +16,8 @@ class TwitterUsername(Metric):
 
     twitter_url_re = re.compile('^https?://(?:www\.)?twitter\.com\.?/(?P<username>[^/]{1,15})')
 
+    provides = ('twitter_username',)
+
     def limit(self, nodeset):
         return nodeset.filter(refuri__exists=True)
 
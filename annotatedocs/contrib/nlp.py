@@ -1,8 +1,13 @@
+from array import array
+import re
+import string
+
 import nltk
 from nltk.stem.porter import PorterStemmer
-from textblob import TextBlob
 from textblob_aptagger import PerceptronTagger
 
+from ..utils import lru_cache
+
 
 FORMS_OF_TO_BE = (
     'to be',
@@ -20,22 +25,136 @@ FORMS_OF_TO_BE = (
 VERB_PAST_PARTICIBLE = 'VBN'
 
 
+# Tags that match this are dropped, like ``TextBlob.tags`` does.
+PUNCTUATION_REGEX = re.compile('[{0}]'.format(re.escape(string.punctuation)))
+
+
 stemmer = PorterStemmer()
 
 # Maybe speedup the startup.
 pos_tagger = PerceptronTagger()
 
 
+# The vocabulary of a documentation is small, so most words are stemmed
+# many times.
+@lru_cache(maxsize=65536)
 def stem_word(word):
     stemmed_word = stemmer.stem(word)
     stemmed_word = stemmed_word.lower()
     return stemmed_word
 
 
+_sentence_tokenizer = None
+
+
+def get_sentence_tokenizer():
+    '''
+    Return the punkt tokenizer that ``nltk.sent_tokenize`` uses. It is only
+    loaded once.
+    '''
+    global _sentence_tokenizer
+    if _sentence_tokenizer is None:
+        _sentence_tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
+    return _sentence_tokenizer
+
+
+class TokenizedText(object):
+    '''
+    The tokens of a text as returned by ``tokenize()``. The tokens of all
+    sentences are kept in one flat list. ``sentence_ends`` holds the index
+    after the last token of every sentence.
+    '''
+
+    def __init__(self, char_count, tokens, sentence_ends):
+        self.char_count = char_count
+        self.tokens = tokens
+        self.sentence_ends = sentence_ends
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def get_sentences(self):
+        '''
+        Return the tokens of every sentence as list of lists.
+        '''
+        start = 0
+        sentences = []
+        for end in self.sentence_ends:
+            sentences.append(self.tokens[start:end])
+            start = end
+        return sentences
+
+    def get_words(self):
+        '''
+        Return the tokens without punctuation, like ``TextBlob.words``.
+        '''
+        words = []
+        for token in self.tokens:
+            word = token.strip().strip(string.punctuation)
+            if word:
+                # Keep the parts of contractions, like the "'s" in "Let's".
+                words.append(token if token.startswith("'") else word)
+        return words
+
+    def get_tagger_input(self):
+        '''
+        Return the tokens in the format that the part of speech tagger takes
+        as pretokenized text: one sentence per line and the tokens separated
+        by spaces.
+        '''
+        return u'\n'.join(
+            u' '.join(sentence)
+            for sentence in self.get_sentences())
+
+
+def tokenize(text):
+    '''
+    Split ``text`` into sentences and the sentences into tokens, like
+    ``nltk.sent_tokenize`` and ``nltk.word_tokenize`` do. Return a
+    ``TokenizedText``.
+    '''
+    tokens = []
+    sentence_ends = array('l')
+    for sentence in get_sentence_tokenizer().tokenize(text):
+        tokens.extend(nltk.word_tokenize(sentence))
+        sentence_ends.append(len(tokens))
+    return TokenizedText(len(text), tokens, sentence_ends)
+
+
+def get_words(text):
+    '''
+    Return the words of ``text`` without punctuation. The result is the same
+    as ``TextBlob(text).words`` would give, but without the setup of a
+    ``TextBlob``.
+    '''
+    return tokenize(text).get_words()
+
+
+def tag_tokenized_text(tagger_input):
+    '''
+    Return the part of speech tags for the output of
+    ``TokenizedText.get_tagger_input()``.
+    '''
+    return [
+        (word, tag)
+        for word, tag in pos_tagger.tag(tagger_input, tokenize=False)
+        if not PUNCTUATION_REGEX.match(tag)]
+
+
 def get_pos_tags(text):
-    blob = TextBlob(text, pos_tagger=pos_tagger)
-    tags = blob.tags
-    return tags
+    return get_pos_tags_batch([text])[0]
+
+
+def get_pos_tags_batch(texts):
+    '''
+    Return the part of speech tags for each of ``texts``. The result is the
+    same as ``TextBlob(text).tags`` would give for every text, but the texts
+    are tokenized and tagged with the shared tagger directly. That saves the
+    setup of a ``TextBlob`` for every text.
+    '''
+    return [
+        tag_tokenized_text(tokenize(text).get_tagger_input())
+        for text in texts]
 
 
 def is_to_be(tags, position):
@@ -1,11 +1,10 @@
 import re
 
 from ... import Check, Hint, PageType, metrics
-from ...utils import normalize_document_path
 from ..metrics.emailaddress import EmailAddress
 from ..metrics.references import References
 from ..metrics.sectiontitle import SectionTitleContainsKeywords
-from ..metrics.stemmer import Stemmer
+from ..metrics.stemmer import Stemmer, stem_keywords
 from ..metrics.twitterusername import TwitterUsername
 
 
@@ -48,23 +47,16 @@ class HasContactInformation(Check):
         'mailinglist',
     )
 
-    def __init__(self, *args, **kwargs):
-        super(HasContactInformation, self).__init__(*args, **kwargs)
-        self.stemmed_keywords = set(Stemmer.stem(
-            ' '.join(self.mailing_list_keywords)))
-
     def check(self, nodeset, document):
         twitter_usernames = nodeset.filter(twitter_username__exists=True)
-        if twitter_usernames.count():
+        if twitter_usernames.exists():
             return
         email_addresses = nodeset.filter(email_address__exists=True)
-        if email_addresses.count():
-            return
-        mentions_mailinglist = nodeset.filter(stemmed_words__exists=True)
-        mentions_mailinglist = mentions_mailinglist.filter(
-            lambda node: set(node['stemmed_words']) & self.stemmed_keywords)
-        if mentions_mailinglist.count():
+        if email_addresses.exists():
             return
+        for stem in stem_keywords(self.mailing_list_keywords):
+            if nodeset.filter(stemmed_words__contains=stem).exists():
+                return
         document.annotate(self.annotation)
 
 
@@ -85,7 +77,7 @@ class HasReportIssueSection(Check):
         return nodeset.filter(is_report_issue_section=True)
 
     def check(self, nodeset, document):
-        if nodeset.count() == 0:
+        if not nodeset.exists():
             document.annotate(self.annotation)
 
 
@@ -153,8 +145,6 @@ class ContributionGuide(PageType):
         [^/]*$
         ''', re.VERBOSE)
 
-    def match(self, document):
-        name = normalize_document_path(document.name)
-        if self.name_regex.search(name):
-            return 0.8
-        return 0
+    path_patterns = [
+        (name_regex, 0.8),
+    ]
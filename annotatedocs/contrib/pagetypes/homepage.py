@@ -1,8 +1,5 @@
-import re
-
 from ... import metrics
 from ... import Check, PageType, Metric, Hint, Warning
-from ...utils import normalize_document_path
 from ..metrics.textstats import TextStats
 
 
@@ -12,20 +9,18 @@ def is_toctree(node):
     return 'toctree-wrapper' in node.attributes.get('classes', [])
 
 
-def is_part_of_toctree(node):
-    current = node
-    while current:
-        if is_toctree(current):
-            return True
-        current = current.parent
-    return False
-
-
 class TocPosition(Metric):
+    provides = ('before_toc', 'after_toc', 'part_of_toc')
+
     def apply_to_document(self, document):
+        # The nodes are visited in document order, so a node is part of the
+        # toc if its id is lower than the subtree end of the last toctree.
         before_toc = True
-        for node in document.nodeset.all():
-            if is_part_of_toctree(node):
+        toc_end = -1
+        for node in document.iter_nodes():
+            if node.node_id < toc_end or is_toctree(node):
+                if node.node_id >= toc_end:
+                    toc_end = document.data.get_subtree_end(node.node_id)
                 before_toc = False
                 node['before_toc'] = False
                 node['after_toc'] = False
@@ -47,7 +42,7 @@ class HasTableOfContents(Check):
 
     def check(self, nodeset, document):
         toctrees = nodeset.filter(part_of_toc=True)
-        if len(toctrees) == 0:
+        if not toctrees.exists():
             # Add annotation if there is no toctree directive used.
             document.annotate(self.annotation)
 
@@ -62,7 +57,7 @@ class HasIntroduction(Check):
 
     def check(self, nodeset, document):
         # There is no toc on the document. So leave this check.
-        if nodeset.filter(part_of_toc=True).count() == 0:
+        if not nodeset.filter(part_of_toc=True).exists():
             return
 
         paragraphs = nodeset.filter(before_toc=True, sentence_count__exists=True)
@@ -83,7 +78,7 @@ class NoContentAfterToc(Check):
 
     def check(self, nodeset, document):
         after_toc = nodeset.filter(after_toc=True)
-        if len(after_toc) > 0:
+        if after_toc.exists():
             after_toc.filter(type="paragraph").annotate(self.annotation)
 
 
@@ -94,12 +89,7 @@ class Homepage(PageType):
         NoContentAfterToc,
     ]
 
-    name_regex = re.compile("^(index(page|[_.][a-z]{2})?)$")
-
-    def match(self, document):
-        name = normalize_document_path(document.name)
-        if name == "index":
-            return 1
-        if self.name_regex.search(name):
-            return 0.8
-        return 0
+    path_patterns = [
+        ("^index$", 1),
+        ("^(index(page|[_.][a-z]{2})?)$", 0.8),
+    ]
@@ -2,7 +2,6 @@ from __future__ import division
 import re
 
 from ... import Check, PageType, Hint, metrics
-from ...utils import normalize_document_path
 from ..metrics.references import References
 from ..metrics.sectiontitle import SectionTitleContainsKeywords
 
@@ -29,7 +28,7 @@ class HasCodeListing(Check):
         return nodeset.filter(type='literal_block')
 
     def check(self, nodeset, document):
-        if nodeset.count() == 0:
+        if not nodeset.exists():
             document.annotate(self.annotation)
 
 
@@ -62,7 +61,7 @@ class HasDependenciesSection(Check):
         return nodeset.filter(is_dependency_section=True)
 
     def check(self, nodeset, document):
-        if nodeset.count() == 0:
+        if not nodeset.exists():
             document.annotate(self.annotation)
 
 
@@ -88,7 +87,7 @@ class LinkToDependencies(Check):
     def check(self, nodeset, document):
         for section in nodeset:
             external_refs = section.nodeset.filter(is_external_ref=True)
-            if external_refs.count() == 0:
+            if not external_refs.exists():
                 section.annotate(self.annotation)
 
 
@@ -114,7 +113,7 @@ class HasNextLink(Check):
         last_section = nodeset.last()
         if last_section:
             internal_refs = last_section.nodeset.filter(is_internal_ref=True)
-            if internal_refs.count() == 0:
+            if not internal_refs.exists():
                 last_section.annotate(self.annotation)
 
 
@@ -144,8 +143,6 @@ class InstallationGuide(PageType):
         (/|$)
     ''', re.VERBOSE)
 
-    def match(self, document):
-        name = normalize_document_path(document.name)
-        if self.name_regex.search(name):
-            return 0.8
-        return 0
+    path_patterns = [
+        (name_regex, 0.8),
+    ]
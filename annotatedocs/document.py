@@ -1,6 +1,13 @@
+from array import array
+from functools import partial
+from multiprocessing import Pool
+
+from docutils.nodes import Element
 from logbook import Logger
 
+from .metrics.graph import MetricGraph
 from .nodeset import NodeSet
+from .rollup import rollup
 from .utils import instantiate
 
 
@@ -8,6 +15,7 @@ log = Logger(__name__)
 
 
 NO_DEFAULT = object()
+MISSING = object()
 
 
 def walk(node, func):
@@ -16,6 +24,51 @@ def walk(node, func):
         walk(child, func)
 
 
+def apply_metric_level(graph, metrics, documents_by_metric):
+    '''
+    Apply independent metrics, each to its documents. All metrics are started
+    before the first one is completed, so that the worker processes can work
+    on all of them at once.
+
+    The metrics that are only applied node by node are fused: every document
+    is walked once and its nodes are dispatched to all of them.
+    '''
+    started = []
+    fused = []
+    fused_by_document = {}
+    for metric in metrics:
+        metric_id = graph.get_id(metric)
+        documents = [
+            document
+            for document in documents_by_metric[metric]
+            if metric_id not in document.applied_metrics]
+        if not documents:
+            continue
+        # The metric must not trigger itself through its own pending keys
+        # while it is applied.
+        for document in documents:
+            document.discard_pending_metric(metric_id)
+        metric_instance = instantiate(metric)
+        if metric_instance.can_be_fused():
+            for document in documents:
+                if document not in fused_by_document:
+                    fused.append(document)
+                    fused_by_document[document] = []
+                fused_by_document[document].append(metric_instance)
+            finish = None
+        else:
+            finish = metric_instance.start_documents(documents)
+        started.append((metric_instance, documents, finish))
+
+    for document in fused:
+        document.apply_fused_metrics(fused_by_document[document])
+    for metric_instance, documents, finish in started:
+        if finish is not None:
+            finish()
+        for document in documents:
+            document.metric_applied(metric_instance)
+
+
 class DocumentStructure(object):
     '''
     This is the document structure as given by the documentation project.
@@ -26,10 +79,22 @@ class DocumentStructure(object):
     The ``Document`` instances will usually hold a reference to the structure.
     This allows traversing the whole document structure in order to attach
     annotations to related documents.
+
+    Metrics can spread CPU heavy work over ``jobs`` worker processes with
+    the ``map()`` method. The work is done in the main process if ``jobs``
+    is ``1``. The optional ``cache`` is a ``ResultCache`` that metrics can
+    use to store their results between builds.
     '''
 
-    def __init__(self, documents, bundle):
+    # Every worker gets about this many chunks of items in ``map()``.
+    chunks_per_job = 4
+
+    def __init__(self, documents, bundle, jobs=1, cache=None):
         self.bundle = bundle
+        self.jobs = jobs
+        self.cache = cache
+        self._pool = None
+        self._metric_graph = None
         self.global_annotations = []
         self.documents = {}
         if documents:
@@ -37,8 +102,9 @@ class DocumentStructure(object):
                 self.add_document(name, document)
 
     def add_document(self, name, node):
-        self.documents[name] = Document(node, self.bundle, name,
-                                            structure=self)
+        document = Document(node, self.bundle, name, structure=self)
+        self.documents[name] = document
+        return document
 
     def get_document(self, name):
         return self.documents[name]
@@ -47,8 +113,113 @@ class DocumentStructure(object):
         return self.global_annotations
 
     def analyze(self):
-        for name, document in self.documents.items():
-            document.analyze()
+        '''
+        Analyze all documents that were not analyzed yet.
+        '''
+        documents = [
+            document
+            for document in self.documents.values()
+            if not document.is_analyzed]
+        if self.bundle is not None:
+            path_scores = self.bundle.get_path_scores(
+                [document.name for document in documents])
+            for document in documents:
+                document.path_scores = path_scores[document.name]
+        # Determining the page types and running the checks can apply
+        # metrics as well, so the pool is only closed when all is done.
+        try:
+            for document in documents:
+                document.determine_page_types()
+            self.apply_required_metrics(documents)
+            for document in documents:
+                first_annotation = len(self.global_annotations)
+                document.analyze()
+                document.global_annotations = (
+                    self.global_annotations[first_annotation:])
+        finally:
+            self.close_pool()
+
+    def get_pool(self):
+        if self._pool is None:
+            log.debug('Starting {} worker processes'.format(self.jobs))
+            self._pool = Pool(processes=self.jobs)
+        return self._pool
+
+    def close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def map(self, func, items):
+        '''
+        Return the list of ``func(item)`` for all items. The items are
+        processed in chunks by the worker processes if there is more than one
+        job. ``func`` and the items need to be picklable then.
+        '''
+        return self.map_async(func, items)()
+
+    def map_async(self, func, items):
+        '''
+        Like ``map()`` but returns right after the items were handed to the
+        worker processes. Returns a function that waits for the results and
+        returns them.
+        '''
+        items = list(items)
+        if self.jobs <= 1 or len(items) < 2:
+            results = map(func, items)
+            return lambda: results
+
+        chunk_count = self.jobs * self.chunks_per_job
+        chunk_size = (len(items) + chunk_count - 1) // chunk_count
+        chunks = [
+            items[start:start + chunk_size]
+            for start in xrange(0, len(items), chunk_size)]
+        pending = self.get_pool().map_async(partial(map, func), chunks)
+
+        def get_results():
+            results = []
+            for chunk_results in pending.get():
+                results.extend(chunk_results)
+            return results
+        return get_results
+
+    def get_metric_graph(self):
+        if self.bundle is not None:
+            return self.bundle.get_metric_graph()
+        if self._metric_graph is None:
+            self._metric_graph = MetricGraph()
+        return self._metric_graph
+
+    def apply_metric(self, metric, documents):
+        '''
+        Apply the metric to all of ``documents`` that it was not applied to
+        yet, in a single batch.
+        '''
+        self.apply_metric_level([metric], dict.fromkeys([metric], documents))
+
+    def apply_metric_level(self, metrics, documents_by_metric):
+        apply_metric_level(self.get_metric_graph(), metrics,
+                           documents_by_metric)
+
+    def apply_required_metrics(self, documents):
+        '''
+        Apply the metrics that the checks of the documents require before the
+        checks are run. Every metric is applied to all documents that need it
+        at once, so the metric can process them in bulk. The metrics of one
+        dependency level are applied concurrently.
+        '''
+        graph = self.get_metric_graph()
+        requested = []
+        documents_by_metric = {}
+        for document in documents:
+            for metric in document.get_required_metrics():
+                if metric not in documents_by_metric:
+                    requested.append(metric)
+                    documents_by_metric[metric] = []
+                documents_by_metric[metric].append(document)
+        for level in graph.get_levels(requested):
+            self.apply_metric_level(level, documents_by_metric)
 
     def annotate(self, annotation):
         self.global_annotations.append(annotation)
@@ -73,6 +244,18 @@ class Document(object):
 
     ``is_analyzed``
         Is set to ``True`` after the analyzation is completed.
+
+    ``applied_metrics``
+        The ids of the metrics that were applied to the document.
+
+    ``global_annotations``
+        The annotations that the checks of this document added to the
+        document structure.
+
+    ``path_scores``
+        The matches of the page types that are classified by the document's
+        name, as determined by ``Bundle.get_path_scores()``. It will be
+        ``None`` if the document was not classified yet.
     '''
 
     nodeset_class = NodeSet
@@ -95,12 +278,16 @@ class Document(object):
         self.structure = structure
 
         self.data = DocumentData(self.node, document=self)
+        self.index = DocumentIndex(self)
 
         # Data that is set during analyzing phase.
         self.page_types = None
         self.is_analyzed = False
         self.applied_metrics = set()
         self.applied_checks = set()
+        self.global_annotations = []
+        self.path_scores = None
+        self._metric_graph = None
 
     def __repr__(self):
         return '<{class_name}: {name}>'.format(
@@ -122,23 +309,149 @@ class Document(object):
     def __getitem__(self, node):
         return self.data[node]
 
+    def iter_nodes(self):
+        """
+        Yield the ``NodeData`` of every node in the document in document order
+        (pre-order).
+        """
+        return self.data.iter_node_data()
+
+    def get_metric_graph(self):
+        if self.structure is not None:
+            return self.structure.get_metric_graph()
+        if self.bundle is not None:
+            return self.bundle.get_metric_graph()
+        if self._metric_graph is None:
+            self._metric_graph = MetricGraph()
+        return self._metric_graph
+
     def apply_metric(self, metric):
-        # TODO: Move this into the metric so that it can decide itself if it
-        # want's to be applied multiple times or not.
-        if metric in self.applied_metrics:
+        '''
+        Apply the metric, unless a metric with the same id was already
+        applied. Its requirements need to be applied before.
+        '''
+        metric_id = self.get_metric_graph().get_id(metric)
+        if metric_id in self.applied_metrics:
             return
+        self.discard_pending_metric(metric_id)
 
         # Finally apply metric.
         metric_instance = instantiate(metric)
         metric_instance.apply_to_document(self)
-        self.applied_metrics.add(metric)
+        self.metric_applied(metric_instance)
+
+    def metric_applied(self, metric_instance):
+        '''
+        Record that ``metric_instance`` was applied to the document.
+        '''
+        metric_id = metric_instance.get_id()
+        self.applied_metrics.add(metric_id)
+        self.index.build(metric_instance.indexed_keys)
+        self.index.build_inverted(metric_instance.inverted_keys)
+        self.discard_pending_metric(metric_id)
+
+    def require_metrics(self, metrics):
+        '''
+        Make sure the metrics and their requirements are applied before their
+        results are used. Metrics that declare the node data keys they
+        provide are applied lazily, the first time one of their keys is read
+        or filtered on. All other metrics are applied right away.
+        '''
+        graph = self.get_metric_graph()
+        pending_keys = self.data.pending_keys
+        eager = []
+        for metric in graph.get_order(metrics):
+            if graph.get_id(metric) in self.applied_metrics:
+                continue
+            provides = instantiate(metric).provides
+            if not provides:
+                eager.append(metric)
+            for key in provides:
+                pending_keys.setdefault(key, metric)
+        self.apply_metrics(eager)
+
+    def apply_pending_key(self, key):
+        '''
+        Apply the pending metric that provides ``key``.
+        '''
+        metric = self.data.pending_keys[key]
+        self.discard_pending_metric(self.get_metric_graph().get_id(metric))
+        self.apply_metrics([metric])
+
+    def discard_pending_metric(self, metric_id):
+        '''
+        Remove all pending keys of the metric with the id ``metric_id``, so
+        that reading them no longer applies the metric.
+        '''
+        pending_keys = self.data.pending_keys
+        if not pending_keys:
+            return
+        graph = self.get_metric_graph()
+        for key, metric in pending_keys.items():
+            if graph.get_id(metric) == metric_id:
+                del pending_keys[key]
 
     def apply_metrics(self, metrics):
-        for metric in metrics:
-            self.apply_metric(metric)
+        '''
+        Apply the metrics and all their requirements in the order of the
+        bundle's execution plan.
+        '''
+        graph = self.get_metric_graph()
+        for level in graph.get_levels(metrics):
+            apply_metric_level(graph, level, dict.fromkeys(level, [self]))
+
+    def apply_fused_metrics(self, metric_instances):
+        '''
+        Apply the metrics node by node in a single walk over the document.
+        Only the nodes that are part of the metric's ``limit()`` are
+        dispatched to it.
+
+        If all limits were resolved from the index, only their candidates are
+        visited instead of every node.
+        '''
+        matchers = []
+        for metric_instance in metric_instances:
+            matcher = metric_instance.limit(self.nodeset).get_matcher()
+            if matcher is None:
+                metric_instance.apply_to_document(self)
+            else:
+                matchers.append((matcher, metric_instance.apply))
+        if not matchers:
+            return
+
+        candidates = [matcher.candidates for matcher, apply in matchers]
+        if any(ids is None for ids in candidates):
+            node_ids = xrange(len(self.data))
+        else:
+            node_ids = sorted(set().union(*candidates))
+        document_data = self.data
+        dispatch = [(matcher.match, apply) for matcher, apply in matchers]
+        for node_id in node_ids:
+            for match, apply in dispatch:
+                node = match(document_data, node_id)
+                if node is not None:
+                    apply(node, self)
+
+    def determine_page_types(self):
+        if self.page_types is None:
+            self.page_types = self.bundle.determine_page_types(document=self)
+        return self.page_types
+
+    def get_required_metrics(self):
+        '''
+        Return the metrics that the checks of the document's page types
+        require, in the order they need to be applied.
+        '''
+        required_metrics = []
+        for page_type in self.determine_page_types():
+            for check in page_type.get_checks(self):
+                for metric in check.required_metrics:
+                    if metric not in required_metrics:
+                        required_metrics.append(metric)
+        return self.get_metric_graph().get_order(required_metrics)
 
     def analyze(self):
-        self.page_types = self.bundle.determine_page_types(document=self)
+        self.determine_page_types()
         for page_type in self.page_types:
             page_type.apply_checks(document=self)
         self.is_analyzed = True
@@ -154,10 +467,115 @@ class Document(object):
         return self[self.node].annotations
 
 
+class DocumentIndex(object):
+    '''
+    Maps the values of selected node data keys to the nodes that carry them.
+
+    The index is built once for a set of keys, usually right after the metric
+    that sets those keys was applied (see ``Metric.indexed_keys``). The
+    ``NodeSet`` then resolves ``filter(key=value)`` lookups on indexed keys
+    straight from the index instead of walking the whole tree.
+
+    The ids of the nodes for every value are stored in document order. Keys
+    whose values are not hashable cannot be indexed and are silently skipped.
 
-class NodeData(dict):
-    def __init__(self, node, document_data):
+    Keys that hold lists, like ``stemmed_words``, can be indexed by their
+    items instead (see ``Metric.inverted_keys``). The
+    ``filter(key__contains=item)`` lookups are then resolved from the index.
+    '''
+
+    def __init__(self, document):
+        self.document = document
+        self._keys = {}
+        self._inverted_keys = {}
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def build(self, keys):
+        document_data = self.document.data
+        for key in keys:
+            if key in self._keys:
+                continue
+            column = document_data.columns.get(key, {})
+            entries = {}
+            try:
+                for node_id, value in sorted(column.items()):
+                    if value not in entries:
+                        entries[value] = array('l')
+                    entries[value].append(node_id)
+            except TypeError:
+                log.debug(
+                    'Cannot index unhashable values of key `{}`.'.format(key))
+                continue
+            self._keys[key] = entries
+
+    def build_inverted(self, keys):
+        document_data = self.document.data
+        for key in keys:
+            if key in self._inverted_keys:
+                continue
+            column = document_data.columns.get(key, {})
+            entries = {}
+            try:
+                for node_id, items in sorted(column.items()):
+                    for item in set(items):
+                        if item not in entries:
+                            entries[item] = array('l')
+                        entries[item].append(node_id)
+            except TypeError:
+                log.debug(
+                    'Cannot index unhashable items of key `{}`.'.format(key))
+                continue
+            self._inverted_keys[key] = entries
+
+    def is_inverted(self, key):
+        return key in self._inverted_keys
+
+    def lookup_ids(self, key, value):
+        '''
+        Return the ids of the nodes that have ``value`` set for ``key``.
+
+        Raises a ``KeyError`` if ``key`` is not indexed and a ``TypeError`` if
+        ``value`` is not hashable.
+        '''
+        return self._keys[key].get(value, ())
+
+    def lookup(self, key, value):
+        '''
+        Return the list of nodes that have ``value`` set for ``key``.
+        '''
+        get_node_data = self.document.data.get_node_data
+        return [
+            get_node_data(node_id)
+            for node_id in self.lookup_ids(key, value)]
+
+    def lookup_ids_containing(self, key, item):
+        '''
+        Return the ids of the nodes whose value for ``key`` contains
+        ``item``.
+
+        Raises a ``KeyError`` if ``key`` is not indexed by its items and a
+        ``TypeError`` if ``item`` is not hashable.
+        '''
+        return self._inverted_keys[key].get(item, ())
+
+
+class NodeData(object):
+    '''
+    A lightweight view on the data that is stored for a single node in the
+    ``DocumentData``. It behaves like a dictionary, so metrics can use
+    ``node['key'] = value`` to store their results.
+
+    Views are created on demand and are not cached. So compare them with
+    ``==`` instead of ``is``.
+    '''
+
+    __slots__ = ('node', 'node_id', 'document_data')
+
+    def __init__(self, node, node_id, document_data):
         self.node = node
+        self.node_id = node_id
         self.document_data = document_data
 
     def __repr__(self):
@@ -165,6 +583,57 @@ class NodeData(dict):
             class_name=self.__class__.__name__,
             node_type=self.node.__class__.__name__)
 
+    def __getitem__(self, key):
+        value = self.document_data.get_value(self.node_id, key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.document_data.set_value(self.node_id, key, value)
+
+    def __delitem__(self, key):
+        self.document_data.delete_value(self.node_id, key)
+
+    def __contains__(self, key):
+        return self.document_data.has_value(self.node_id, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        return self.document_data.get_keys(self.node_id)
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        return self.document_data.get_value(self.node_id, key, default)
+
+    def setdefault(self, key, default=None):
+        value = self.document_data.get_value(self.node_id, key, MISSING)
+        if value is MISSING:
+            self[key] = value = default
+        return value
+
+    def pop(self, key, default=MISSING):
+        value = self.document_data.get_value(self.node_id, key, default)
+        if value is MISSING:
+            raise KeyError(key)
+        if key in self:
+            del self[key]
+        return value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
     def append(self, key, value):
         self.setdefault(key, []).append(value)
 
@@ -177,13 +646,20 @@ class NodeData(dict):
 
     @property
     def children(self):
-        document = self.document_data.document
-        return [document[child] for child in self.node.children]
+        document_data = self.document_data
+        return [document_data[child] for child in self.node.children]
 
     def __eq__(self, other):
-        if self.node is None:
-            return self is other
-        return self.node is getattr(other, 'node', None)
+        return (
+            isinstance(other, NodeData) and
+            self.node_id == other.node_id and
+            self.document_data is other.document_data)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.document_data), self.node_id))
 
     @property
     def nodeset(self):
@@ -206,15 +682,102 @@ class NodeData(dict):
         """
         Return the `NodeData` instance for the parent of the docutils node.
         """
-        if self.node.parent:
-            return self.document_data[self.node.parent]
-        else:
+        parent_id = self.document_data.get_parent_id(self.node_id)
+        if parent_id is None:
             return None
+        return self.document_data.get_node_data(parent_id)
+
+    def is_within(self, other):
+        """
+        Return ``True`` if this node is ``other`` or one of its descendants.
+        """
+        return (
+            self.document_data is other.document_data and
+            self.document_data.is_within(self.node_id, other.node_id))
+
+    def is_descendant_of(self, other):
+        return self.node_id != other.node_id and self.is_within(other)
+
+    def is_before(self, other):
+        """
+        Return ``True`` if this node and its whole subtree come before
+        ``other`` in the document. Ancestors of ``other`` are not before it.
+        """
+        return (
+            self.document_data is other.document_data and
+            self.document_data.get_subtree_end(self.node_id) <= other.node_id)
+
+    def is_after(self, other):
+        """
+        Return ``True`` if this node comes after ``other`` and its subtree in
+        the document.
+        """
+        return (
+            self.document_data is other.document_data and
+            self.node_id >= self.document_data.get_subtree_end(other.node_id))
 
     # Alias methods that pass the calls through to the docutils node instance.
 
     def astext(self):
-        return self.node.astext()
+        return self.document_data.get_text(self.node_id)
+
+    def invalidate_text(self):
+        self.document_data.invalidate_text(self.node_id)
+
+
+class DenseColumn(object):
+    '''
+    A column of the ``DocumentData`` that holds a value for most of the nodes.
+    The values are stored in a list that is indexed by the node id. It has the
+    same interface as the ``dict`` that is used for sparse columns.
+    '''
+
+    __slots__ = ('values', 'count')
+
+    def __init__(self, size, items=()):
+        self.values = [MISSING] * size
+        self.count = 0
+        for node_id, value in items:
+            self[node_id] = value
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, node_id):
+        return self.get(node_id, MISSING) is not MISSING
+
+    def get(self, node_id, default=None):
+        if node_id < len(self.values):
+            value = self.values[node_id]
+            if value is not MISSING:
+                return value
+        return default
+
+    def __getitem__(self, node_id):
+        value = self.get(node_id, MISSING)
+        if value is MISSING:
+            raise KeyError(node_id)
+        return value
+
+    def __setitem__(self, node_id, value):
+        values = self.values
+        if node_id >= len(values):
+            values.extend([MISSING] * (node_id + 1 - len(values)))
+        if values[node_id] is MISSING:
+            self.count += 1
+        values[node_id] = value
+
+    def __delitem__(self, node_id):
+        if node_id not in self:
+            raise KeyError(node_id)
+        self.values[node_id] = MISSING
+        self.count -= 1
+
+    def items(self):
+        return [
+            (node_id, value)
+            for node_id, value in enumerate(self.values)
+            if value is not MISSING]
 
 
 class DocumentData(object):
@@ -223,24 +786,269 @@ class DocumentData(object):
 
     The data contains the calculated metrics as well as the generated
     annotations.
+
+    Every node gets a dense integer id, assigned in document order
+    (pre-order) when the ``DocumentData`` is created. The subtree of a node
+    therefore covers the consecutive ids from the node's id up to its
+    subtree end (exclusive), which turns ancestor, descendant and
+    before/after tests into integer comparisons. The data is stored in
+    columns, one per key, which map the node id to the value. Columns start
+    as a ``dict`` and are turned into a ``DenseColumn`` once a value is set
+    for the majority of nodes. So the memory grows with the data the metrics
+    actually set, not with the number of nodes.
+
+    ``NodeData`` objects are only views on this store and are created on
+    demand.
+
+    The texts of the nodes (as returned by ``astext()``) are computed for the
+    whole tree in one pass on first access, every parent joining the texts of
+    its children. Code that changes the children of a registered node after
+    that needs to call ``invalidate_text()`` for it. Registering new nodes
+    does that for their parent.
     '''
 
     node_data_class = NodeData
 
+    # Turn a column into a ``DenseColumn`` if more than this fraction of the
+    # nodes has a value set.
+    dense_column_ratio = 0.5
+
     def __init__(self, node, document=None):
         self.document = document
         self.root_node = node
-        self._data = {}
 
-    def _init_node(self, node):
-        self._data[node] = self.node_data_class(node, document_data=self)
+        # Maps the node id to the docutils node.
+        self.nodes = []
+        # Maps the node id to the id of its parent. -1 is used for nodes
+        # without parent.
+        self.parent_ids = array('l')
+        # Maps the node id to the first id after the node's subtree.
+        self.subtree_ends = array('l')
+        # The ids of docutils nodes are used to find a node's id.
+        # ``docutils.nodes.Text`` is a ``unicode`` subclass, so two text nodes
+        # with the same content would otherwise be treated as the same.
+        self._node_ids = {}
+        # Maps the key to the column.
+        self.columns = {}
+        # Maps keys to the metrics that set them but are only applied once
+        # the key is accessed. See ``Document.require_metrics()``.
+        self.pending_keys = {}
+        # Maps the node id to the node's text, or ``None`` if the text needs
+        # to be computed. ``None`` as long as no text was requested.
+        self._texts = None
+
+        self._register_tree(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _register_tree(self, node):
+        first_id = len(self.nodes)
+        parent = node.parent
+        root_parent_id = self._node_ids.get(id(parent), -1)
+        to_visit = [(node, root_parent_id)]
+        while to_visit:
+            node, parent_id = to_visit.pop()
+            node_id = self._register_node(node, parent_id)
+            to_visit.extend(
+                (child, node_id) for child in reversed(node.children))
+
+        # A node's subtree ends where the subtree of its last child ends. So
+        # going backwards we can pass the ends up to the parents. Nodes
+        # registered later on are not added to the subtrees of nodes that
+        # already had an id.
+        subtree_ends = self.subtree_ends
+        parent_ids = self.parent_ids
+        for node_id in xrange(len(self.nodes) - 1, first_id - 1, -1):
+            parent_id = parent_ids[node_id]
+            if (parent_id >= first_id and
+                    subtree_ends[node_id] > subtree_ends[parent_id]):
+                subtree_ends[parent_id] = subtree_ends[node_id]
+
+        if self._texts is not None:
+            self._texts.extend([None] * (len(self.nodes) - len(self._texts)))
+            if root_parent_id != -1:
+                self.invalidate_text(root_parent_id)
+
+    def _register_node(self, node, parent_id):
+        node_id = len(self.nodes)
+        self.nodes.append(node)
+        self.parent_ids.append(parent_id)
+        self.subtree_ends.append(node_id + 1)
+        self._node_ids[id(node)] = node_id
+        return node_id
+
+    def get_node_id(self, node):
+        '''
+        Return the id of the docutils node. Nodes that were not part of the
+        tree when the ``DocumentData`` was created get an id assigned on first
+        access.
+        '''
+        try:
+            return self._node_ids[id(node)]
+        except KeyError:
+            self._register_tree(node)
+            return self._node_ids[id(node)]
+
+    def get_node_data(self, node_id):
+        return self.node_data_class(
+            self.nodes[node_id],
+            node_id,
+            document_data=self)
+
+    def get_parent_id(self, node_id):
+        parent_id = self.parent_ids[node_id]
+        if parent_id == -1:
+            return None
+        return parent_id
+
+    def get_subtree_end(self, node_id):
+        '''
+        Return the first id after the subtree of the node. The subtree
+        consists of the ids ``node_id`` up to the returned id.
+        '''
+        return self.subtree_ends[node_id]
+
+    def iter_child_ids(self, node_id):
+        subtree_end = self.subtree_ends[node_id]
+        child_id = node_id + 1
+        while child_id < subtree_end:
+            yield child_id
+            child_id = self.subtree_ends[child_id]
+
+    def iter_ancestor_ids(self, node_id):
+        '''
+        Yield the ids of the node's ancestors, starting with the parent.
+        '''
+        parent_id = self.parent_ids[node_id]
+        while parent_id != -1:
+            yield parent_id
+            parent_id = self.parent_ids[parent_id]
+
+    def is_within(self, node_id, root_id):
+        '''
+        Return ``True`` if the node is the root node or one of its
+        descendants.
+        '''
+        return root_id <= node_id < self.subtree_ends[root_id]
+
+    def rollup(self, key, func='sum', boundaries=(), node_ids=None):
+        '''
+        Return the aggregated values of ``key`` for the subtree of every
+        node, as list indexed by the node id. See
+        ``annotatedocs.rollup.rollup`` for the details.
+        '''
+        if self.pending_keys:
+            self.provide_keys([key])
+        return rollup(self, key, func, boundaries, node_ids)
+
+    def get_text(self, node_id):
+        '''
+        Return the text of the node, the same as the docutils node's
+        ``astext()`` would return.
+        '''
+        if self._texts is None:
+            self._compute_texts()
+        text = self._texts[node_id]
+        if text is None:
+            text = self._texts[node_id] = self._compute_text(
+                self.nodes[node_id])
+        return text
+
+    def invalidate_text(self, node_id):
+        '''
+        Forget the text of the node and its ancestors. Call this after the
+        subtree of the node was changed.
+        '''
+        if self._texts is None:
+            return
+        self._texts[node_id] = None
+        for ancestor_id in self.iter_ancestor_ids(node_id):
+            self._texts[ancestor_id] = None
+
+    def _compute_texts(self):
+        # The children have higher ids than their parent. So going backwards
+        # the texts of the children are known when their parent is reached.
+        nodes = self.nodes
+        self._texts = [None] * len(nodes)
+        for node_id in xrange(len(nodes) - 1, -1, -1):
+            self._texts[node_id] = self._compute_text(nodes[node_id])
+
+    def _compute_text(self, node):
+        # Only nodes that use the default implementation are joined from the
+        # texts of their children, the others (like text nodes or images)
+        # compute their text themselves.
+        if getattr(node.__class__.astext, 'im_func', None) is not (
+                Element.astext.im_func):
+            return node.astext()
+        texts = self._texts
+        child_texts = []
+        for child in node.children:
+            child_id = self._node_ids.get(id(child))
+            if child_id is None or texts[child_id] is None:
+                child_texts.append(child.astext())
+            else:
+                child_texts.append(texts[child_id])
+        return node.child_text_separator.join(child_texts)
 
     def __getitem__(self, node):
+        return self.get_node_data(self.get_node_id(node))
+
+    def iter_node_data(self):
+        '''
+        Yield the ``NodeData`` for all nodes in document order.
+        '''
+        for node_id in xrange(len(self.nodes)):
+            yield self.get_node_data(node_id)
+
+    def provide_keys(self, keys):
+        '''
+        Apply the pending metrics that set any of ``keys``.
+        '''
+        if self.pending_keys:
+            for key in keys:
+                if key in self.pending_keys:
+                    self.document.apply_pending_key(key)
+
+    def get_value(self, node_id, key, default=None):
+        if self.pending_keys:
+            self.provide_keys((key,))
+        column = self.columns.get(key)
+        if column is None:
+            return default
+        return column.get(node_id, default)
+
+    def has_value(self, node_id, key):
+        if self.pending_keys:
+            self.provide_keys((key,))
+        column = self.columns.get(key)
+        return column is not None and node_id in column
+
+    def set_value(self, node_id, key, value):
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = {}
+        column[node_id] = value
+        if (type(column) is dict and
+                len(column) > len(self.nodes) * self.dense_column_ratio):
+            self.columns[key] = DenseColumn(len(self.nodes), column.items())
+
+    def delete_value(self, node_id, key):
+        column = self.columns.get(key)
+        if column is None:
+            raise KeyError(key)
         try:
-            return self._data[node]
+            del column[node_id]
         except KeyError:
-            self._init_node(node)
-            return self._data[node]
+            raise KeyError(key)
+
+    def get_keys(self, node_id):
+        if self.pending_keys:
+            self.provide_keys(list(self.pending_keys))
+        return [
+            key
+            for key, column in self.columns.items()
+            if node_id in column]
 
     def get(self, node, key, default=NO_DEFAULT):
         '''
@@ -0,0 +1,132 @@
+import cPickle as pickle
+import os
+
+from logbook import Logger
+
+from .utils import instantiate
+
+
+__all__ = ('AnalysisStore',)
+
+
+log = Logger(__name__)
+
+
+class AnalysisStore(object):
+    '''
+    Keeps the results of the analysis of every document between builds. An
+    incremental build then only needs to analyze the documents that changed.
+
+    For every document the store keeps the annotations of its nodes, the
+    names of its page types and the global annotations that its checks added
+    to the document structure. The other node data often references the
+    nodes of the document and is not kept.
+
+    All records are dropped if the ``fingerprint`` differs from the one of
+    the stored records, e.g. because another bundle is used. ``is_fresh`` is
+    ``False`` in that case and all documents need to be analyzed again.
+
+    The records are only kept in memory if ``path`` is ``None``.
+    '''
+
+    def __init__(self, path=None, fingerprint=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.records = {}
+        self.is_fresh = False
+        self.load()
+
+    def load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except IOError:
+            return
+        except Exception as e:
+            log.warning(
+                'Cannot read the stored analysis from {}: {}'.format(
+                    self.path, e))
+            return
+        if data.get('fingerprint') != self.fingerprint:
+            log.debug('The stored analysis is outdated.')
+            return
+        self.records = data['records']
+        self.is_fresh = True
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({
+                'fingerprint': self.fingerprint,
+                'records': self.records,
+            }, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.path)
+        self.is_fresh = True
+
+    def add_document(self, document):
+        annotated_nodes = document.nodeset.filter(annotations__exists=True)
+        self.records[document.name] = {
+            'node_count': len(document.data),
+            'annotations': dict(
+                (node.node_id, [
+                    annotation.detach()
+                    for annotation in node.annotations])
+                for node in annotated_nodes),
+            'page_types': [
+                unicode(page_type)
+                for page_type in document.page_types],
+            'global_annotations': [
+                annotation.detach()
+                for annotation in document.global_annotations],
+        }
+
+    def remove_missing(self, docnames):
+        '''
+        Drop the records of all documents that are not in ``docnames``.
+        '''
+        for docname in list(self.records):
+            if docname not in docnames:
+                del self.records[docname]
+
+    def get_global_annotations(self):
+        return [
+            annotation
+            for docname in sorted(self.records)
+            for annotation in self.records[docname]['global_annotations']]
+
+    def restore_document(self, document):
+        '''
+        Restore the analysis of the document from its record. Return
+        ``False`` if there is no record that fits the document.
+        '''
+        record = self.records.get(document.name)
+        if record is None or record['node_count'] != len(document.data):
+            return False
+
+        bundle = document.bundle
+        page_types_by_name = dict(
+            (unicode(page_type), page_type)
+            for page_type in (
+                list(bundle.get_page_types()) +
+                list(bundle.get_fallback_page_types())))
+        if any(name not in page_types_by_name
+               for name in record['page_types']):
+            return False
+
+        for node_id, annotations in record['annotations'].items():
+            node = document.data.get_node_data(node_id)
+            for annotation in annotations:
+                node.annotate(annotation)
+        document.page_types = [
+            page_types_by_name[name] for name in record['page_types']]
+        for page_type in document.page_types:
+            document.applied_checks.update(
+                instantiate(check)
+                for check in page_type.get_checks(document))
+        document.global_annotations = list(record['global_annotations'])
+        document.is_analyzed = True
+        return True
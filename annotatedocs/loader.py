@@ -97,6 +97,12 @@ class Loader(object):
         '''
         raise NotImplementedError('Needs to be implemented by subclass.')
 
+    def get_cache_file(self):
+        '''
+        The file in which the metric results are cached between builds.
+        '''
+        return os.path.join(self.get_tmp_dir(), 'cache.sqlite')
+
     def get_virtualenv_dir(self):
         return os.path.join(self.get_tmp_dir(), 'venv')
 
@@ -191,23 +197,42 @@ class Loader(object):
         activate_this = os.path.join(virtuelenv_dir, 'bin', 'activate_this.py')
         execfile(activate_this, {'__file__': activate_this})
 
-    def build(self, confoverrides=None):
+    def build(self, confoverrides=None, jobs=1, incremental=False,
+              streaming=False):
+        '''
+        Build the annotated documentation. Incremental builds keep the
+        doctrees in the tmp dir and only analyze the documents that changed
+        since the last build. Streaming builds analyze and write one document
+        at a time.
+        '''
+        if incremental:
+            return self.run_build(self.doctrees_dir, confoverrides, jobs,
+                                  incremental=True, streaming=streaming)
         with tempdir() as doctrees_dir:
-            app = AnnotatedSphinx(
-                srcdir=unicode(self.get_docs_dir()),
-                confdir=unicode(self.get_docs_dir()),
-                outdir=unicode(self.get_build_dir()),
-                doctreedir=unicode(doctrees_dir),
-                buildername='html',
-                confoverrides=confoverrides or {})
-            app.build(force_all=True)
-            index_file = os.path.join(
-                self.get_build_dir(),
-                'index.html')
-            log.info(
-                'Build finished. Open file://{path} in your browser to see '
-                'the annotations.'.format(path=index_file))
-            return index_file
+            return self.run_build(doctrees_dir, confoverrides, jobs,
+                                  streaming=streaming)
+
+    def run_build(self, doctrees_dir, confoverrides=None, jobs=1,
+                  incremental=False, streaming=False):
+        app = AnnotatedSphinx(
+            srcdir=unicode(self.get_docs_dir()),
+            confdir=unicode(self.get_docs_dir()),
+            outdir=unicode(self.get_build_dir()),
+            doctreedir=unicode(doctrees_dir),
+            buildername='html',
+            confoverrides=confoverrides or {},
+            jobs=jobs,
+            cache_file=self.get_cache_file(),
+            incremental=incremental,
+            streaming=streaming)
+        app.build(force_all=not incremental)
+        index_file = os.path.join(
+            self.get_build_dir(),
+            'index.html')
+        log.info(
+            'Build finished. Open file://{path} in your browser to see '
+            'the annotations.'.format(path=index_file))
+        return index_file
 
     def cleanup(self):
         '''
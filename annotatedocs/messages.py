@@ -0,0 +1,105 @@
+import json
+import os
+
+from logbook import Logger
+
+
+__all__ = ('MessageTable',)
+
+
+log = Logger(__name__)
+
+
+class MessageTable(object):
+    '''
+    Interns the serialized annotations of a build. Every distinct annotation
+    is stored once and referenced by its index in the table. The HTML pages
+    then only carry the lists of references and the table is written once as
+    static file, that ``annotate.js`` resolves the references with.
+
+    The global annotations are part of the table as well, so that they are
+    not repeated on every page.
+
+    The table is a script that assigns the JSON data to a global variable,
+    so that it can be loaded with a ``<script>`` tag, even if the pages are
+    opened from the file system.
+
+    New annotations are only appended. An incremental build loads the table
+    of the previous build, so that the references of the pages that are not
+    written again stay valid.
+    '''
+
+    prefix = 'window.annotatedocsMessages = '
+    suffix = ';\n'
+
+    def __init__(self, messages=()):
+        self.messages = []
+        self.global_refs = []
+        self._refs = {}
+        for data in messages:
+            self.add_data(data)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Return the table that was saved to ``path``. An empty table is
+        returned if there is no readable table.
+        '''
+        try:
+            with open(path) as f:
+                content = f.read()
+            if not (content.startswith(cls.prefix) and
+                    content.endswith(cls.suffix)):
+                raise ValueError('Unknown format')
+            data = json.loads(content[len(cls.prefix):-len(cls.suffix)])
+            return cls(data['messages'])
+        except IOError:
+            return cls()
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning(
+                'Cannot read the annotation messages from {}: {}'.format(
+                    path, e))
+            return cls()
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            f.write(self.dumps())
+
+    def dumps(self):
+        return self.prefix + json.dumps({
+            'messages': self.messages,
+            'global': self.global_refs,
+        }) + self.suffix
+
+    def add_data(self, data):
+        '''
+        Add a serialized annotation and return its reference.
+        '''
+        key = (data['message'], data['level'], data.get('title'))
+        ref = self._refs.get(key)
+        if ref is None:
+            ref = self._refs[key] = len(self.messages)
+            self.messages.append(data)
+        return ref
+
+    def add(self, annotation):
+        return self.add_data(annotation.serialize())
+
+    def dump_refs(self, annotations):
+        '''
+        Return the references of the annotations as JSON list, or ``None``
+        if there are no annotations.
+        '''
+        if not annotations:
+            return None
+        return '[{}]'.format(','.join(
+            str(self.add(annotation))
+            for annotation in annotations))
+
+    def set_global_annotations(self, annotations):
+        self.global_refs = [
+            self.add(annotation)
+            for annotation in annotations]
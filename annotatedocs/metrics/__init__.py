@@ -1,2 +1,3 @@
 from .base import *
+from .graph import *
 from .nodetype import *
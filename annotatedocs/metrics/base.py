@@ -1,4 +1,8 @@
-__all__ = ('require', 'MetricRequirementMixin', 'Metric')
+from ..cache import hash_text
+from .graph import MetricGraph
+
+
+__all__ = ('require', 'MetricRequirementMixin', 'Metric', 'TextMetric')
 
 
 class MetricRequirementMixin(object):
@@ -16,10 +20,9 @@ class MetricRequirementMixin(object):
                 ComplexMetric,
             ]
 
-    You can either give metric classes or instances of metric classes. Giving
-    metric classes is prefered since we check for the object ID to see if we
-    already have applied this metric yet. So if you give the same metric as two
-    different instances, it will be applied twice.
+    You can either give metric classes or instances of metric classes. A
+    metric is only applied once per document, metrics are told apart by the
+    return value of ``Metric.get_id()``.
 
     Unfortunatelly the ``required_metrics`` attribute cannot be altered in the
     instance of classes. Actually it can be altered, but won't have any effect.
@@ -40,17 +43,9 @@ class MetricRequirementMixin(object):
         Resolve all dependencies and bring them in the correct order.
 
         Requirements that should be applied first will be returned first.
+        Raises ``CircularDependencyError`` if a metric depends on itself.
         '''
-
-        # TODO: Check for circular dependencies.
-        dependencies = []
-        class_metrics = list(cls.required_metrics)
-        for required in class_metrics:
-            for dependency in required.get_required_metrics():
-                if dependency in dependencies:
-                    continue
-                dependencies.append(dependency)
-        return dependencies + class_metrics
+        return MetricGraph().get_order(cls.required_metrics)
 
 
 def require(*metrics):
@@ -100,20 +95,57 @@ def require(*metrics):
 
 
 class Metric(MetricRequirementMixin, object):
+    # Names of node data keys that the document shall index after this metric
+    # was applied. Equality lookups on these keys (like
+    # ``nodeset.filter(type='paragraph')``) are then resolved from the index
+    # instead of walking the whole tree. Only list keys that are not changed
+    # anymore after the metric was applied.
+    indexed_keys = ()
+
+    # Names of node data keys that hold lists. The document indexes the nodes
+    # by every item of those lists, so that ``contains`` lookups (like
+    # ``nodeset.filter(stemmed_words__contains='bug')``) are resolved from
+    # the index.
+    inverted_keys = ()
+
+    # Names of node data keys that this metric sets. Metrics that list their
+    # keys can be applied lazily: ``Document.require_metrics()`` only applies
+    # them once one of the keys is read or filtered on. Metrics that leave
+    # this empty are applied right away.
+    provides = ()
+
+    # Metrics that support caching their results set this to a version
+    # string. Change it whenever the results of the metric change for the
+    # same input, so that the cached results are not used anymore.
+    cache_version = None
+
+    def __new__(cls, *args, **kwargs):
+        metric = super(Metric, cls).__new__(cls)
+        # Remember the constructor arguments, they are part of the id.
+        metric._init_args = (args, kwargs)
+        return metric
+
     def get_id(self):
         """
-        Return qualified name for this metric class.
+        Return qualified name for this metric class. The arguments that the
+        metric was created with are appended, so that metrics of the same
+        class with different parameters get different IDs.
 
-        The return (will be in the future) used to determine if the metric was
-        already applied. An ID for a metric will be only applied once. If you
-        want to be able to apply the same metric twice to a document, you must
-        return different IDs (e.g. return a stringifyed timestamp with high
-        precision).
+        The return is used to determine if the metric was already applied. An
+        ID for a metric will be only applied once. If you want to be able to
+        apply the same metric twice to a document, you must return different
+        IDs (e.g. return a stringifyed timestamp with high precision).
         """
-        # TODO: Make use of this method.
-        return '.'.join((
+        metric_id = '.'.join((
             self.__module__,
             self.__class__.__name__))
+        args, kwargs = getattr(self, '_init_args', ((), {}))
+        params = [repr(arg) for arg in args] + [
+            '{}={!r}'.format(name, kwargs[name])
+            for name in sorted(kwargs)]
+        if params:
+            metric_id += '({})'.format(', '.join(params))
+        return metric_id
 
     def limit(self, nodeset):
         '''
@@ -127,5 +159,128 @@ class Metric(MetricRequirementMixin, object):
         for node in self.limit(nodeset):
             self.apply(node, document)
 
+    def apply_to_documents(self, documents):
+        '''
+        Apply the metric to all of the given documents. Subclasses can
+        override this if they can process the nodes of many documents faster
+        in one batch.
+        '''
+        for document in documents:
+            self.apply_to_document(document)
+
+    def start_documents(self, documents):
+        '''
+        Start applying the metric to all of the given documents and return a
+        function that completes it. Metrics that hand their work to the worker
+        processes return before the work is done, so that the independent
+        metrics of a dependency level run at the same time.
+        '''
+        self.apply_to_documents(documents)
+        return lambda: None
+
+    def can_be_fused(self):
+        '''
+        Return ``True`` if the metric is only applied node by node with
+        ``apply()``. Such metrics share a single walk over the document with
+        the other metrics of their dependency level.
+        '''
+        cls = self.__class__
+        return all(
+            getattr(cls, name).im_func is getattr(Metric, name).im_func
+            for name in (
+                'apply_to_document',
+                'apply_to_documents',
+                'start_documents'))
+
     def apply(self, node, document):
         raise NotImplementedError('Needs to be implemented by subclass.')
+
+
+class TextMetric(Metric):
+    '''
+    Base class for metrics that compute their values from the text of a node
+    alone. The texts of all documents are computed in one batch. That batch
+    is spread over worker processes if the document structure was set up
+    with more than one job.
+
+    Subclasses set ``compute`` to a function that takes the text and returns
+    the result. It must be defined on module level, so that it can be sent
+    to the worker processes. ``store`` then adds the result to the node.
+
+    Every distinct text is only computed once. If the metric has a
+    ``cache_version`` and the document structure has a result cache, the
+    results are only computed for texts that are not in the cache yet.
+    '''
+
+    compute = None
+
+    def get_text(self, node):
+        return node.astext()
+
+    def apply_to_document(self, document):
+        self.apply_to_documents([document])
+
+    def apply_to_documents(self, documents):
+        self.start_documents(documents)()
+
+    def start_documents(self, documents):
+        nodes = [
+            node
+            for document in documents
+            for node in self.limit(document.nodeset)]
+        texts = [self.get_text(node) for node in nodes]
+        structure = documents[0].structure if documents else None
+        get_results = self.start_compute_all(texts, structure)
+
+        def finish():
+            for node, result in zip(nodes, get_results()):
+                self.store(node, result)
+        return finish
+
+    def compute_all(self, texts, structure=None):
+        return self.start_compute_all(texts, structure)()
+
+    def start_compute_all(self, texts, structure=None):
+        '''
+        Start computing the results for the texts. Returns a function that
+        waits for the results and returns them.
+        '''
+        # Documentations often repeat the same text, e.g. code examples. So
+        # every distinct text is only computed once.
+        text_hashes = [hash_text(text) for text in texts]
+        unique = dict(zip(text_hashes, texts))
+
+        cache = getattr(structure, 'cache', None)
+        if cache is None or self.cache_version is None:
+            cache = None
+            results = {}
+        else:
+            results = cache.get_many(
+                self.get_id(), self.cache_version, unique.keys())
+        missing = dict(
+            (text_hash, text)
+            for text_hash, text in unique.items()
+            if text_hash not in results)
+        get_computed = self.map_async(missing.values(), structure)
+
+        def get_results():
+            if missing:
+                computed = dict(zip(missing.keys(), get_computed()))
+                if cache is not None:
+                    cache.set_many(
+                        self.get_id(), self.cache_version, computed)
+                results.update(computed)
+            return [results[text_hash] for text_hash in text_hashes]
+        return get_results
+
+    def map(self, texts, structure=None):
+        return self.map_async(texts, structure)()
+
+    def map_async(self, texts, structure=None):
+        if structure is not None:
+            return structure.map_async(self.compute, texts)
+        results = map(self.compute, texts)
+        return lambda: results
+
+    def store(self, node, result):
+        raise NotImplementedError('Needs to be implemented by subclass.')
@@ -0,0 +1,106 @@
+from ..utils import instantiate
+
+
+__all__ = ('CircularDependencyError', 'MetricGraph')
+
+
+class CircularDependencyError(Exception):
+    pass
+
+
+class MetricGraph(object):
+    '''
+    The dependency graph of metrics. Metrics are identified by the return
+    value of ``Metric.get_id()``, so a metric that is required as a class in
+    one place and as an instance in another is only applied once.
+
+    A ``CircularDependencyError`` is raised as soon as a metric is added that
+    depends on itself.
+
+    ``get_levels()`` returns the plan in which the metrics are applied: the
+    metrics of a level only depend on metrics of earlier levels, so the
+    metrics of one level can be applied concurrently. The plans are cached,
+    so they are only computed once for every set of requested metrics.
+    '''
+
+    def __init__(self, metrics=()):
+        # Maps the metric id to the first metric that was added with that id.
+        self.metrics = {}
+        self.dependencies = {}
+        # The order in which the metrics were added, dependencies first.
+        self.order = []
+        self._ids = {}
+        self._plans = {}
+        self.add_all(metrics)
+
+    def get_id(self, metric):
+        if metric not in self._ids:
+            self._ids[metric] = instantiate(metric).get_id()
+        return self._ids[metric]
+
+    def add(self, metric, _path=()):
+        '''
+        Add the metric and all its requirements to the graph. Return the id
+        of the metric.
+        '''
+        metric_id = self.get_id(metric)
+        if metric_id in _path:
+            cycle = _path[_path.index(metric_id):] + (metric_id,)
+            raise CircularDependencyError(
+                'Circular metric dependency: {}'.format(' -> '.join(cycle)))
+        if metric_id in self.metrics:
+            return metric_id
+
+        path = _path + (metric_id,)
+        dependencies = []
+        for required in metric.required_metrics:
+            dependency = self.add(required, path)
+            if dependency not in dependencies:
+                dependencies.append(dependency)
+        self.metrics[metric_id] = metric
+        self.dependencies[metric_id] = dependencies
+        self.order.append(metric_id)
+        return metric_id
+
+    def add_all(self, metrics):
+        return [self.add(metric) for metric in metrics]
+
+    def get_levels(self, metrics):
+        '''
+        Return the given metrics and all their requirements as a list of
+        levels. Every level is a list of metrics that only depend on the
+        metrics of the levels before.
+        '''
+        key = frozenset(self.add_all(metrics))
+        if key not in self._plans:
+            self._plans[key] = self._plan(key)
+        return self._plans[key]
+
+    def get_order(self, metrics):
+        '''
+        Return the given metrics and all their requirements in the order in
+        which they need to be applied.
+        '''
+        return [
+            metric
+            for level in self.get_levels(metrics)
+            for metric in level]
+
+    def _plan(self, metric_ids):
+        depths = {}
+
+        def get_depth(metric_id):
+            if metric_id not in depths:
+                depths[metric_id] = 1 + max([-1] + [
+                    get_depth(dependency)
+                    for dependency in self.dependencies[metric_id]])
+            return depths[metric_id]
+
+        for metric_id in metric_ids:
+            get_depth(metric_id)
+
+        levels = [[] for depth in range(max(depths.values() or [-1]) + 1)]
+        for metric_id in self.order:
+            if metric_id in depths:
+                levels[depths[metric_id]].append(self.metrics[metric_id])
+        return levels
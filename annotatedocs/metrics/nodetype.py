@@ -24,6 +24,9 @@ class NodeType(Metric):
         'language',
     ]
 
+    indexed_keys = ('type', 'class_name')
+    provides = ('type', 'class_name', 'is_content_type') + tuple(attributes)
+
     def apply(self, node, document):
         class_name = node.node.__class__.__name__
         node_type = self.class_to_type.get(class_name, class_name)
@@ -1,24 +1,306 @@
-def lookup(check):
-    def _lookup(key, test_value):
-        def _test_node(node):
-            if key in node:
-                return check(node[key], test_value)
-            return False
-        return _test_node
-    return _lookup
-
-
-def exists_lookup(key, test_value):
-    def _test_node(node):
-        exists = key in node
-        # Return true if it exists. But only if we got ``True`` as lookup.
-        if test_value:
-            return exists
-        # If the lookup was filter(key__exists=False) we want to invert the
-        # result.
+from bisect import bisect_left
+from itertools import islice
+import operator
+import sys
+
+
+MISSING = object()
+
+
+class IdRanges(object):
+    '''
+    A set of node ids, stored as sorted and disjoint ``[start, stop)``
+    ranges.
+    '''
+
+    def __init__(self):
+        self.starts = []
+        self.stops = []
+
+    def add(self, start, stop):
+        '''
+        Add the ids from ``start`` up to ``stop`` and return the parts of the
+        range that were not yet in the set, as a list of ``(start, stop)``
+        tuples.
+        '''
+        if start >= stop:
+            return []
+        starts = self.starts
+        stops = self.stops
+        # All ranges from ``first`` to ``last`` overlap or touch the new one
+        # and get merged with it.
+        first = last = bisect_left(stops, start)
+        added = []
+        position = start
+        while last < len(starts) and starts[last] <= stop:
+            if starts[last] > position:
+                added.append((position, starts[last]))
+            position = max(position, stops[last])
+            last += 1
+        if position < stop:
+            added.append((position, stop))
+        if last > first:
+            start = min(start, starts[first])
+            stop = max(stop, stops[last - 1])
+        starts[first:last] = [start]
+        stops[first:last] = [stop]
+        return added
+
+
+class FilterPlan(object):
+    '''
+    The compiled form of a nodeset's filters.
+
+    All keyword lookups on the same key are merged, so that the node data is
+    only accessed once per key. The keys are checked cheapest first (see
+    ``NodeSet.lookup_costs``) and the callables given to ``filter()`` come
+    last. Lookups that contradict each other, like
+    ``filter(type='section').filter(type='title')``, make the plan match
+    nothing without looking at a single node.
+
+    If an ``index`` is given, one ``exact`` lookup on an indexed key is
+    resolved from it. ``candidates`` then holds the sorted ids of the
+    matching nodes and the lookup is not repeated by ``match()``. Without
+    such a lookup, one ``contains`` lookup on a key that is indexed by its
+    items is resolved instead.
+
+    The ``positions`` restrict the nodes relative to other nodes of the same
+    document. They are ``('within', node)``, ``('before', node)`` and
+    ``('after', node)`` tuples and are compiled into the ``id_range`` the
+    nodes must be in. Nodes before a node must also end before it, which is
+    checked against ``subtree_stop``.
+    '''
+
+    def __init__(self, lookups, filters, lookup_types, lookup_costs,
+                 default_lookup_cost, index=None, positions=()):
+        self.lookup_types = lookup_types
+        self.lookup_costs = lookup_costs
+        self.default_lookup_cost = default_lookup_cost
+
+        self.matches_nothing = False
+        self.candidates = None
+        self.filters = list(filters)
+        # A list of ``(key, must_exist, tests)`` tuples. ``tests`` is a list
+        # of ``(test_func, test_value)`` tuples.
+        self.key_checks = []
+        # The document data the ``id_range`` refers to.
+        self.document_data = None
+        self.id_range = None
+        self.subtree_stop = sys.maxint
+
+        self._compile(lookups, index)
+        self._compile_positions(positions)
+
+    def _group_lookups(self, lookups):
+        '''
+        Return the lookups grouped by key as a list of
+        ``(key, exists, tests)`` tuples. ``exists`` is ``None`` if there was no
+        ``exists`` lookup for the key.
+        '''
+        keys = []
+        by_key = {}
+        for key, lookup_type, test_value in lookups:
+            if key not in by_key:
+                keys.append(key)
+                by_key[key] = [None, []]
+            spec = by_key[key]
+            if lookup_type == 'exists':
+                exists = bool(test_value)
+                if spec[0] is not None and spec[0] != exists:
+                    self.matches_nothing = True
+                spec[0] = exists
+            elif (lookup_type, test_value) not in spec[1]:
+                spec[1].append((lookup_type, test_value))
+        return [(key, by_key[key][0], by_key[key][1]) for key in keys]
+
+    def _compile(self, lookups, index):
+        groups = self._group_lookups(lookups)
+        if self.matches_nothing:
+            return
+
+        key_checks = []
+        for key, exists, tests in groups:
+            exact_values = [
+                test_value
+                for lookup_type, test_value in tests
+                if lookup_type == 'exact']
+            if any(value != exact_values[0] for value in exact_values[1:]):
+                self.matches_nothing = True
+            if tests and exists is False:
+                self.matches_nothing = True
+            if self.matches_nothing:
+                return
+
+            if (exact_values and self.candidates is None and
+                    index is not None and key in index):
+                try:
+                    self.candidates = index.lookup_ids(
+                        key, exact_values[0])
+                except TypeError:
+                    pass
+                else:
+                    # All candidates carry the value, so there is nothing
+                    # left to check for this key.
+                    continue
+
+            tests = sorted(tests, key=lambda test: self.get_cost(test[0]))
+            if tests:
+                cost = self.get_cost(tests[0][0])
+            else:
+                cost = self.get_cost('exists')
+            key_checks.append((
+                cost,
+                key,
+                exists is not False,
+                [(self.lookup_types[lookup_type], test_value)
+                 for lookup_type, test_value in tests]))
+
+        if self.candidates is None and index is not None:
+            key_checks = self._resolve_contains(key_checks, index)
+
+        key_checks.sort(key=lambda check: check[0])
+        self.key_checks = [check[1:] for check in key_checks]
+
+    def _resolve_contains(self, key_checks, index):
+        '''
+        Resolve the first ``contains`` lookup on a key that is indexed by its
+        items. Return the remaining key checks.
+        '''
+        contains = self.lookup_types['contains']
+        for position, (cost, key, must_exist, tests) in enumerate(key_checks):
+            if not index.is_inverted(key):
+                continue
+            for test in tests:
+                if test[0] is not contains:
+                    continue
+                try:
+                    self.candidates = index.lookup_ids_containing(
+                        key, test[1])
+                except TypeError:
+                    continue
+                tests = [other for other in tests if other is not test]
+                key_checks = list(key_checks)
+                if tests:
+                    key_checks[position] = (cost, key, must_exist, tests)
+                else:
+                    # The candidates carry the key, so there is nothing left
+                    # to check for it.
+                    del key_checks[position]
+                return key_checks
+        return key_checks
+
+    def _compile_positions(self, positions):
+        if not positions:
+            return
+        document_data = positions[0][1].document_data
+        start = 0
+        stop = sys.maxint
+        for position, node in positions:
+            if node.document_data is not document_data:
+                self.matches_nothing = True
+                return
+            subtree_end = document_data.get_subtree_end(node.node_id)
+            if position == 'within':
+                start = max(start, node.node_id)
+                stop = min(stop, subtree_end)
+            elif position == 'before':
+                stop = min(stop, node.node_id)
+                self.subtree_stop = min(self.subtree_stop, node.node_id)
+            elif position == 'after':
+                start = max(start, subtree_end)
+        if start >= stop:
+            self.matches_nothing = True
+        self.document_data = document_data
+        self.id_range = (start, stop)
+
+    def get_cost(self, lookup_type):
+        return self.lookup_costs.get(lookup_type, self.default_lookup_cost)
+
+    def clip(self, document_data, start, stop):
+        '''
+        Limit the id range from ``start`` to ``stop`` to the ``id_range``.
+        '''
+        if self.id_range is None:
+            return start, stop
+        if document_data is not self.document_data:
+            return start, start
+        return max(start, self.id_range[0]), min(stop, self.id_range[1])
+
+    def accept(self, node):
+        return self.match(node.document_data, node.node_id) is not None
+
+    def match(self, document_data, node_id):
+        '''
+        Return the ``NodeData`` for the node if it passes the plan, otherwise
+        ``None``. The view is only created once all keyword lookups passed.
+        '''
+        if self.id_range is not None:
+            if document_data is not self.document_data:
+                return None
+            if not self.id_range[0] <= node_id < self.id_range[1]:
+                return None
+            if document_data.subtree_ends[node_id] > self.subtree_stop:
+                return None
+
+        # Read the values straight from the columns of the document data
+        # instead of going through the node data's mapping interface.
+        columns = document_data.columns
+        for key, must_exist, tests in self.key_checks:
+            column = columns.get(key)
+            if column is None:
+                value = MISSING
+            else:
+                value = column.get(node_id, MISSING)
+            if value is MISSING:
+                if must_exist:
+                    return None
+                continue
+            if not must_exist:
+                return None
+            for test, test_value in tests:
+                if not test(value, test_value):
+                    return None
+        node = document_data.get_node_data(node_id)
+        for filter_func in self.filters:
+            if not filter_func(node):
+                return None
+        return node
+
+
+class NodeMatcher(object):
+    '''
+    Tests single nodes for being part of a nodeset, without evaluating the
+    nodeset. See ``NodeSet.get_matcher()``.
+
+    ``candidates`` is the sorted list of the only node ids that can match if
+    the nodeset's plan was resolved from the index, otherwise ``None``.
+    '''
+
+    def __init__(self, plan, ranges):
+        self.plan = plan
+        self.ranges = ranges
+        self.candidates = plan.candidates
+        if plan.candidates is not None:
+            self._candidate_set = set(plan.candidates)
         else:
-            return not exists
-    return _test_node
+            self._candidate_set = None
+
+    def match(self, document_data, node_id):
+        '''
+        Return the ``NodeData`` for the node if it is part of the nodeset,
+        otherwise ``None``.
+        '''
+        if self.plan.matches_nothing:
+            return None
+        for range_data, start, stop in self.ranges:
+            if range_data is document_data and start <= node_id < stop:
+                break
+        else:
+            return None
+        if (self._candidate_set is not None and
+                node_id not in self._candidate_set):
+            return None
+        return self.plan.match(document_data, node_id)
 
 
 class NodeSet(object):
@@ -52,41 +334,76 @@ class NodeSet(object):
         >>> isinstance(nodedata.node, docutils.nodes.Node)
         True
 
+    By default a nodeset contains the root nodes and all of their
+    descendants. Use the ``children()``, ``descendants()``, ``parent()`` and
+    ``ancestors()`` methods to select other nodes relative to the root nodes::
+
+        >>> section.nodeset.children().filter(type='title').first()
+        <NodeData: title>
+
     The API is heavily inspired by django's querysets.
     '''
 
     default_lookup_type = 'exact'
 
     # Methods given in lookup_types have a special signature.
-    # They take three arguments:
+    # They take two arguments:
     #
-    #   ``key``
-    #       The name of the keyword argument before the two underscores. So for
-    #       ``.filter(foo__contains='bar')``, the key would be ``'foo'``.
+    #   ``value``
+    #       The value that is stored in the node data under the lookup's key.
+    #       So for ``.filter(foo__contains='bar')``, it would be
+    #       ``node['foo']``. Nodes that do not have the key set never match.
     #
     #   ``test_value``
     #       The given value of the keyword argument. In the example above it
     #       would be ``'bar'``.
     #
-    # They shall then based on those arguments return a callable that takes a
-    # node and returns if the node meets a lookup specific criteria.
+    # They shall return if the value meets the lookup specific criteria.
+    #
+    # The ``exists`` lookup is special. It only checks if the key is set and
+    # is handled by the ``FilterPlan`` itself.
 
     lookup_types = {
-        'exact': lookup(lambda a, b: a == b),
-        'contains': lookup(lambda a, b: b in a),
-        'gt': lookup(lambda a, b: a > b),
-        'gte': lookup(lambda a, b: a >= b),
-        'lt': lookup(lambda a, b: a < b),
-        'lte': lookup(lambda a, b: a <= b),
-        'exists': exists_lookup,
+        'exact': operator.eq,
+        'contains': lambda a, b: b in a,
+        'gt': operator.gt,
+        'gte': operator.ge,
+        'lt': operator.lt,
+        'lte': operator.le,
+        'exists': None,
     }
 
+    # Lookups with lower costs are checked first. Lookup types that are not
+    # listed here get the ``default_lookup_cost``.
+    lookup_costs = {
+        'exists': 0,
+        'exact': 1,
+    }
+    default_lookup_cost = 2
+
+    plan_class = FilterPlan
+
     def __init__(self, root_nodes):
         self.root_nodes = list(root_nodes)
         self._filters = []
+        # The keyword lookups as ``(key, lookup_type, test_value)`` tuples.
+        # They are compiled into a ``FilterPlan`` on evaluation.
+        self._lookups = []
+        self._plan = None
+        # Holds the list of matched nodes once the nodeset was fully
+        # evaluated. Clones start with an empty cache.
+        self._result_cache = None
+        # Which nodes relative to the root nodes are considered. ``None``
+        # means the root nodes and all of their descendants. It is set by the
+        # ``children()``, ``descendants()``, ``parent()`` and ``ancestors()``
+        # methods.
+        self._axis = None
+        # The ``(position, node)`` tuples added by ``within()``, ``before()``
+        # and ``after()``.
+        self._positions = []
 
     def __repr__(self):
-        nodes = list(self[:11])
+        nodes = list(self)
         items = ', '.join(
             unicode(node.node.__class__.__name__)
             for node in nodes[:10])
@@ -94,16 +411,42 @@ class NodeSet(object):
             items += ', ...'
         return '<{class_name}: len={count} [{items}]>'.format(
             class_name=self.__class__.__name__,
-            count=self.count(),
+            count=len(nodes),
             items=items)
 
     def _clone(self):
         cloned = self.__class__(self.root_nodes)
         cloned._filters = self._filters[:]
+        cloned._lookups = self._lookups[:]
+        cloned._axis = self._axis
+        cloned._positions = self._positions[:]
         return cloned
 
     def __getitem__(self, i):
-        # TODO: optimize this.
+        '''
+        Indexing with non-negative integers and slicing with non-negative
+        bounds only evaluates the nodeset as far as needed. Slices return a
+        list.
+        '''
+        if self._result_cache is not None:
+            return self._result_cache[i]
+
+        if isinstance(i, slice):
+            start, stop, step = i.start, i.stop, i.step
+            if ((start is None or start >= 0) and
+                    (stop is None or stop >= 0) and
+                    (step is None or step > 0)):
+                return list(islice(self._iter_lazy(), start, stop, step))
+        elif i >= 0:
+            for node in islice(self._iter_lazy(), i, None):
+                return node
+            raise IndexError(u'NodeSet index out of range')
+        elif i == -1:
+            node = self.last()
+            if node is None:
+                raise IndexError(u'NodeSet index out of range')
+            return node
+
         return list(self)[i]
 
     def all(self):
@@ -113,15 +456,16 @@ class NodeSet(object):
         return len(self)
 
     def exists(self):
-        # TODO: Optimize for performance and return True after the first
-        # matching node was found.
-        return self.count() >= 1
+        '''
+        Return ``True`` if the nodeset contains at least one node. The
+        evaluation stops at the first match.
+        '''
+        for node in self._iter_lazy():
+            return True
+        return False
 
     def __len__(self):
-        count = 0
-        for node in self:
-            count += 1
-        return count
+        return len(self._fetch_all())
 
     def filter(self, *args, **kwargs):
         '''
@@ -152,9 +496,7 @@ class NodeSet(object):
             if lookup_type not in self.lookup_types:
                 raise TypeError(u'Unkown lookup: {}'.format(lookup))
 
-            lookup_func = self.lookup_types[lookup_type]
-            filter_func = lookup_func(key, test_value)
-            clone._filters.append(filter_func)
+            clone._lookups.append((key, lookup_type, test_value))
 
         return clone
 
@@ -169,25 +511,85 @@ class NodeSet(object):
         '''
         Returns first item of nodeset or None if the nodeset is empty.
         '''
-        for node in self:
+        for node in self._iter_lazy():
             return node
         return None
 
     def last(self):
         '''
         Returns last item of nodeset or ``None`` if the nodeset is empty.
+
+        The tree is traversed backwards, so the evaluation stops at the last
+        matching node.
         '''
-        try:
-            return list(self)[-1]
-        except IndexError:
-            return None
+        if self._result_cache is not None:
+            nodes = reversed(self._result_cache)
+        else:
+            nodes = self._evaluate_reversed(self.root_nodes)
+        for node in nodes:
+            return node
+        return None
+
+    def _with_axis(self, axis):
+        if self._axis is not None:
+            raise TypeError(
+                u'The nodeset is already limited to the {} of its root '
+                u'nodes. Use subset() to make the current nodes the new root '
+                u'nodes.'.format(self._axis))
+        clone = self._clone()
+        clone._axis = axis
+        return clone
 
     def children(self):
-        def is_children(node):
-            return any(
-                node in root_node.children
-                for root_node in self.root_nodes)
-        return self.filter(is_children)
+        '''
+        Limit the nodeset to the direct children of the root nodes.
+        '''
+        return self._with_axis('children')
+
+    def descendants(self):
+        '''
+        Limit the nodeset to the descendants of the root nodes, excluding the
+        root nodes themselves.
+        '''
+        return self._with_axis('descendants')
+
+    def parent(self):
+        '''
+        Limit the nodeset to the parents of the root nodes.
+        '''
+        return self._with_axis('parent')
+
+    def ancestors(self):
+        '''
+        Limit the nodeset to all ancestors of the root nodes. They are
+        returned in document order, so the outermost node comes first.
+        '''
+        return self._with_axis('ancestors')
+
+    def _with_position(self, position, node):
+        clone = self._clone()
+        clone._positions.append((position, node))
+        return clone
+
+    def within(self, node):
+        '''
+        Limit the nodeset to ``node`` and its descendants.
+        '''
+        return self._with_position('within', node)
+
+    def before(self, node):
+        '''
+        Limit the nodeset to the nodes that end before ``node`` starts. The
+        ancestors of ``node`` are not included.
+        '''
+        return self._with_position('before', node)
+
+    def after(self, node):
+        '''
+        Limit the nodeset to the nodes that start after ``node`` and its
+        descendants.
+        '''
+        return self._with_position('after', node)
 
     def annotate(self, message):
         '''
@@ -213,36 +615,247 @@ class NodeSet(object):
 
         return [get_values(node) for node in self]
 
+    def aggregate(self, key, func='sum', group_by='section'):
+        '''
+        Aggregate the values of ``key`` of the nodes in this nodeset by the
+        closest node of the type ``group_by`` that contains them. ``func`` is
+        one of ``'sum'``, ``'count'``, ``'max'`` and ``'min'``.
+
+        Returns a dict that maps every node of the type ``group_by`` in the
+        documents of the root nodes to its result. The values of nested
+        groups are not included in the result of the outer group::
+
+            >>> word_counts = nodeset.filter(type='paragraph').aggregate(
+            ...     'word_count', 'sum', group_by='section')
+            >>> word_counts[section]
+            120
+
+        All groups of a document are computed in one pass over its nodes.
+        '''
+        node_ids = {}
+        for node in self.filter(**{key + '__exists': True}):
+            node_ids.setdefault(node.document_data, []).append(node.node_id)
+
+        results = {}
+        for document_data in self._get_document_datas():
+            root = document_data.get_node_data(0)
+            group_ids = [
+                group.node_id
+                for group in self.__class__([root]).filter(type=group_by)]
+            if not group_ids:
+                continue
+            totals = document_data.rollup(
+                key, func,
+                boundaries=group_ids,
+                node_ids=node_ids.get(document_data, ()))
+            for group_id in group_ids:
+                group = document_data.get_node_data(group_id)
+                results[group] = totals[group_id]
+        return results
+
+    def _get_document_datas(self):
+        document_datas = []
+        for node in self.root_nodes:
+            if node.document_data not in document_datas:
+                document_datas.append(node.document_data)
+        return document_datas
+
     def none(self):
         return self.__class__([])
 
-    def _accept_node(self, node):
-        for filter_func in self._filters:
-            if not filter_func(node):
-                return False
-        return True
-
-    def _filter_nodes(self, nodes, check, include_children_of_matched=True):
-        found = []
-        to_check = nodes[:]
-        while to_check:
-            current_node = to_check.pop()
-            matched = False
-            if check(current_node):
-                matched = True
-                if current_node not in found:
-                    found.append(current_node)
-                    yield current_node
-            if include_children_of_matched or matched:
-                to_check.extend(reversed(current_node.children))
+    def get_matcher(self):
+        '''
+        Return a ``NodeMatcher`` that tests if single nodes are part of this
+        nodeset. That allows to go over the nodes of a document once and
+        dispatch them to many nodesets.
+
+        Returns ``None`` for nodesets that select nodes relative to other
+        nodes with ``children()``, ``parent()`` or ``ancestors()``.
+        '''
+        if self._axis not in (None, 'descendants'):
+            return None
+        ranges = [
+            (node.document_data,) + self._get_subtree_range(node)
+            for node in self.root_nodes]
+        return NodeMatcher(self._get_plan(), ranges)
+
+    def _get_index(self):
+        '''
+        Return the index of the document the root nodes belong to, or ``None``
+        if there is no such single document.
+        '''
+        if not self.root_nodes:
+            return None
+        document_data = self.root_nodes[0].document_data
+        for root_node in self.root_nodes:
+            if root_node.document_data is not document_data:
+                return None
+        document = document_data.document
+        return getattr(document, 'index', None)
+
+    def _provide_keys(self):
+        '''
+        Apply the pending metrics of the root nodes' documents that provide
+        the keys the lookups check.
+        '''
+        keys = set(key for key, lookup_type, test_value in self._lookups)
+        if not keys:
+            return
+        provided = set()
+        for node in self.root_nodes:
+            document_data = node.document_data
+            if (document_data.pending_keys and
+                    id(document_data) not in provided):
+                provided.add(id(document_data))
+                document_data.provide_keys(keys)
+
+    def _get_plan(self):
+        if self._plan is None:
+            self._provide_keys()
+            # The axes that only look at a few nodes around the root nodes
+            # do not benefit from the index.
+            if self._axis in (None, 'descendants'):
+                index = self._get_index()
+            else:
+                index = None
+            self._plan = self.plan_class(
+                self._lookups,
+                self._filters,
+                lookup_types=self.lookup_types,
+                lookup_costs=self.lookup_costs,
+                default_lookup_cost=self.default_lookup_cost,
+                index=index,
+                positions=self._positions)
+        return self._plan
+
+    def _get_subtree_range(self, node):
+        start = node.node_id
+        stop = node.document_data.get_subtree_end(start)
+        if self._axis == 'descendants':
+            start += 1
+        return start, stop
+
+    def _get_range_ids(self, start, stop, candidates, reverse=False):
+        '''
+        Return the ids from ``start`` up to ``stop``. Only the ids in
+        ``candidates`` are returned if given.
+        '''
+        if candidates is not None:
+            ids = candidates[
+                bisect_left(candidates, start):bisect_left(candidates, stop)]
+            if reverse:
+                return reversed(ids)
+            return ids
+        if reverse:
+            return xrange(stop - 1, start - 1, -1)
+        return xrange(start, stop)
+
+    def _iter_subtree_ids(self, nodes, plan):
+        '''
+        Yields ``(document_data, ids)`` tuples for the subtrees of ``nodes``.
+        The root nodes might overlap, e.g. a section and one of its
+        subsections after calling ``subset()``. Every id is only returned
+        once.
+        '''
+        visited = {}
+        for node in nodes:
+            document_data = node.document_data
+            start, stop = plan.clip(
+                document_data, *self._get_subtree_range(node))
+            if id(document_data) not in visited:
+                visited[id(document_data)] = IdRanges()
+            for start, stop in visited[id(document_data)].add(start, stop):
+                yield document_data, self._get_range_ids(
+                    start, stop, plan.candidates)
+
+    def _iter_unique_ids(self, nodes, get_ids):
+        '''
+        Yields ``(document_data, ids)`` tuples with the ids returned by
+        ``get_ids`` for each of ``nodes``. Every id is only returned once.
+        '''
+        found = set()
+        for node in nodes:
+            document_data = node.document_data
+            ids = []
+            for node_id in get_ids(document_data, node.node_id):
+                if (id(document_data), node_id) not in found:
+                    found.add((id(document_data), node_id))
+                    ids.append(node_id)
+            yield document_data, ids
+
+    def _get_child_ids(self, document_data, node_id):
+        return document_data.iter_child_ids(node_id)
+
+    def _get_parent_ids(self, document_data, node_id):
+        parent_id = document_data.get_parent_id(node_id)
+        if parent_id is None:
+            return ()
+        return (parent_id,)
+
+    def _get_ancestor_ids(self, document_data, node_id):
+        return reversed(list(document_data.iter_ancestor_ids(node_id)))
+
+    def _match(self, plan, id_groups):
+        match = plan.match
+        for document_data, ids in id_groups:
+            for node_id in ids:
+                node = match(document_data, node_id)
+                if node is not None:
+                    yield node
 
     def _evaluate(self, nodes):
         '''
         Resolves the configured nodeset into a list of nodes.
+
+        The nodes are selected by their ids. The subtree of a node covers
+        the consecutive ids up to its subtree end, so the nodes are found
+        without walking the tree.
+        '''
+        plan = self._get_plan()
+        if plan.matches_nothing:
+            return iter(())
+
+        if self._axis == 'children':
+            id_groups = self._iter_unique_ids(nodes, self._get_child_ids)
+        elif self._axis == 'parent':
+            id_groups = self._iter_unique_ids(nodes, self._get_parent_ids)
+        elif self._axis == 'ancestors':
+            id_groups = self._iter_unique_ids(nodes, self._get_ancestor_ids)
+        else:
+            id_groups = self._iter_subtree_ids(nodes, plan)
+        return self._match(plan, id_groups)
+
+    def _evaluate_reversed(self, nodes):
+        '''
+        Like ``_evaluate`` but returns the nodes in reversed order.
+        '''
+        # Overlapping root nodes make it hard to tell in which order the
+        # nodes would be returned. So we only go backwards with a single
+        # root.
+        if len(nodes) != 1 or self._axis not in (None, 'descendants'):
+            return reversed(self._fetch_all())
+        plan = self._get_plan()
+        if plan.matches_nothing:
+            return iter(())
+        document_data = nodes[0].document_data
+        start, stop = plan.clip(
+            document_data, *self._get_subtree_range(nodes[0]))
+        ids = self._get_range_ids(start, stop, plan.candidates, reverse=True)
+        return self._match(plan, [(document_data, ids)])
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._result_cache = list(self._evaluate(self.root_nodes))
+        return self._result_cache
+
+    def _iter_lazy(self):
+        '''
+        Iterate over the nodes without evaluating the whole nodeset upfront.
+        The result is not cached.
         '''
-        return self._filter_nodes(nodes, self._accept_node)
+        if self._result_cache is not None:
+            return iter(self._result_cache)
+        return self._evaluate(self.root_nodes)
 
     def __iter__(self):
-        for item in self._evaluate(self.root_nodes):
-            yield item
-        raise StopIteration
+        return iter(self._fetch_all())
@@ -1,5 +1,7 @@
+import re
+
 from ..metrics import MetricRequirementMixin
-from ..utils import instantiate
+from ..utils import instantiate, normalize_document_path
 
 
 __all__ = ('PageType',)
@@ -16,10 +18,20 @@ class PageType(MetricRequirementMixin, object):
 
     Page types can be grouped into bundles. See the ``Bundle`` class for more
     information.
+
+    Page types that are recognized by the name of the document alone can set
+    ``path_patterns`` instead of implementing ``match()``. It's a list of
+    ``(pattern, score)`` tuples. The match is the highest score of all
+    patterns that are found in the normalized document path (see
+    ``normalize_document_path``). The bundle then classifies all documents by
+    their names in one pass, before any metric is applied.
     """
 
     name = None
     checks = []
+    path_patterns = None
+
+    _compiled_path_patterns = None
 
     def __unicode__(self):
         return unicode(self.name or self.__class__.__name__)
@@ -28,8 +40,43 @@ class PageType(MetricRequirementMixin, object):
         """
         Returns a value between 0 and 1 on how good this page type matches.
         """
+        if self.path_patterns is not None:
+            return self.match_path(normalize_document_path(document.name))
         raise NotImplementedError('Needs to be implemented by subclass.')
 
+    def matches_path_only(self):
+        """
+        Return ``True`` if the match only depends on the ``path_patterns``
+        and not on the content of the document.
+        """
+        return (
+            self.path_patterns is not None and
+            self.__class__.match.im_func is PageType.match.im_func)
+
+    def get_path_patterns(self):
+        """
+        Return the ``path_patterns`` with compiled regular expressions.
+        """
+        if self._compiled_path_patterns is None:
+            self._compiled_path_patterns = [
+                (re.compile(pattern)
+                 if isinstance(pattern, basestring)
+                 else pattern, score)
+                for pattern, score in self.path_patterns or ()]
+        return self._compiled_path_patterns
+
+    def match_path(self, path):
+        """
+        Return the highest score of the ``path_patterns`` that are found in
+        the normalized document ``path``.
+        """
+        if path is None:
+            return 0
+        return max([0] + [
+            score
+            for regex, score in self.get_path_patterns()
+            if regex.search(path)])
+
     def get_checks(self, document):
         """
         This returns the checks that should be applied to the document which
@@ -43,7 +90,7 @@ class PageType(MetricRequirementMixin, object):
             # that were provided as classes.
             check = instantiate(check)
 
-            document.apply_metrics(check.get_required_metrics())
+            document.apply_metrics(check.required_metrics)
 
             nodeset = document.nodeset.all()
             nodeset = check.limit(nodeset)
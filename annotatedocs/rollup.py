@@ -0,0 +1,65 @@
+__all__ = ('rollup', 'ROLLUP_FUNCTIONS')
+
+
+ROLLUP_FUNCTIONS = ('sum', 'count', 'max', 'min')
+
+
+def rollup(document_data, key, func='sum', boundaries=(), node_ids=None):
+    '''
+    Aggregate the values of ``key`` over the subtree of every node of the
+    ``DocumentData`` in one bottom-up pass. ``func`` is one of ``'sum'``,
+    ``'count'``, ``'max'`` and ``'min'``. Return a list that holds the result
+    for every node id.
+
+    The nodes with the ids in ``boundaries`` get the result for their subtree
+    as well, but it is not passed on to their ancestors. So if all sections
+    are boundaries, the result of a section does not include its
+    subsections.
+
+    Only the values of the nodes with the ids in ``node_ids`` are aggregated
+    if it is given. Nodes without a value in their subtree get ``0`` for
+    ``'sum'`` and ``'count'`` and ``None`` for ``'max'`` and ``'min'``.
+
+    The values need to be numbers, unless ``func`` is ``'count'``.
+    '''
+    if func not in ROLLUP_FUNCTIONS:
+        raise ValueError(
+            u'Unknown rollup function `{}`. Use one of: {}'.format(
+                func, u', '.join(ROLLUP_FUNCTIONS)))
+    column = document_data.columns.get(key, {})
+    if node_ids is None:
+        items = column.items()
+    else:
+        items = [
+            (node_id, column[node_id])
+            for node_id in node_ids
+            if node_id in column]
+    if func == 'count':
+        items = [(node_id, 1) for node_id, value in items]
+    parent_ids = document_data.parent_ids
+    boundaries = set(boundaries)
+    identity = 0 if func in ('sum', 'count') else None
+    totals = [identity] * len(parent_ids)
+    for node_id, value in items:
+        totals[node_id] = _combine(func, totals[node_id], value)
+    # Children always have higher ids than their parent. So going backwards,
+    # the total of a node is complete before it is passed to the parent.
+    for node_id in xrange(len(parent_ids) - 1, -1, -1):
+        parent_id = parent_ids[node_id]
+        if parent_id != -1 and node_id not in boundaries:
+            totals[parent_id] = _combine(
+                func, totals[parent_id], totals[node_id])
+    return totals
+
+
+def _combine(func, total, value):
+    if func in ('sum', 'count'):
+        return total + value
+    if total is None:
+        return value
+    if value is None:
+        return total
+    if func == 'max':
+        return max(total, value)
+    return min(total, value)
+
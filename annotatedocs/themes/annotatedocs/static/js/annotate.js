@@ -9,12 +9,21 @@
     }
 
     /*
-     * Get a list of plain JSON objects (read from the HTML attributes) and
-     * return a list of instantiated annotations.
+     * The messages of all annotations of the build. The HTML attributes only
+     * hold references into the list of messages.
      */
-    Annotation.instantiate = function (annotations) {
-        return $.map(annotations, function (annotation) {
-            return new Annotation(annotation);
+    var messageTable = window.annotatedocsMessages || {
+        messages: [],
+        global: []
+    };
+
+    /*
+     * Get a list of references to the message table (read from the HTML
+     * attributes) and return a list of instantiated annotations.
+     */
+    Annotation.instantiate = function (refs) {
+        return $.map(refs, function (ref) {
+            return new Annotation(messageTable.messages[ref]);
         });
     };
 
@@ -107,13 +116,9 @@
             });
         });
 
-        this.$element.find('[data-global-annotations]').each(function () {
-            var annotations = $(this).attr('data-global-annotations');
-            annotations = JSON.parse(annotations);
-            annotations = Annotation.instantiate(annotations);
-            $.each(annotations, function (i, annotation) {
-                self.addGlobalAnnotation(annotation);
-            });
+        var globalAnnotations = Annotation.instantiate(messageTable.global);
+        $.each(globalAnnotations, function (i, annotation) {
+            self.addGlobalAnnotation(annotation);
         });
     };
 
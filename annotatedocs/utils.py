@@ -1,3 +1,5 @@
+from collections import OrderedDict
+from functools import wraps
 import os
 import re
 import shutil
@@ -57,9 +59,61 @@ def instantiate(instance_or_class):
     return instance_or_class
 
 
+def lru_cache(maxsize=1024):
+    """
+    Decorator that remembers the return values of the function for the last
+    ``maxsize`` different positional arguments. The arguments need to be
+    hashable.
+
+    The memo is available as the ``cache`` attribute of the decorated
+    function.
+    """
+
+    def decorator(func):
+        cache = OrderedDict()
+
+        @wraps(func)
+        def wrapper(*args):
+            try:
+                value = cache.pop(args)
+            except KeyError:
+                value = func(*args)
+                if len(cache) >= maxsize:
+                    # Drop the least recently used value.
+                    cache.popitem(last=False)
+            cache[args] = value
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+class DocumentPath(unicode):
+    """
+    A normalized document path as returned by ``normalize_document_path``.
+    The parts of the path between the slashes are available as ``segments``.
+    """
+
+    def __new__(cls, segments):
+        path = super(DocumentPath, cls).__new__(cls, u'/'.join(segments))
+        path.segments = tuple(segments)
+        return path
+
+    def __getnewargs__(self):
+        return (self.segments,)
+
+
+WORD_RE = re.compile(r'^[^a-z]*(?P<word>.+?)\s*$', re.IGNORECASE)
+ACCEPT_NAME_RE = re.compile(r'^.*[a-z]{3}.*$', re.IGNORECASE)
+
+
+@lru_cache(maxsize=8192)
 def normalize_document_path(filename):
-    WORD_RE = re.compile(r'^[^a-z]*(?P<word>.+?)\s*$', re.IGNORECASE)
-    ACCEPT_NAME_RE = re.compile(r'^.*[a-z]{3}.*$', re.IGNORECASE)
+    """
+    Return the ``DocumentPath`` that page types use to recognize a document
+    by its name, or ``None`` if no part of the name is left.
+    """
 
     # Rule 1: Make it lowercase.
     filename = filename.lower()
@@ -76,6 +130,5 @@ def normalize_document_path(filename):
             # Only accept filenames that contain 3 letters or more.
             if ACCEPT_NAME_RE.match(word):
                 bits.append(word)
-    normalized = u'/'.join(bits)
-    if normalized:
-        return normalized
+    if bits:
+        return DocumentPath(bits)
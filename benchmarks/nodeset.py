@@ -0,0 +1,164 @@
+"""
+Benchmarks for evaluating ``NodeSet`` queries on a large synthetic doctree.
+
+Run them from the repository root with::
+
+    python benchmarks/nodeset.py [--nodes 50000] [--repeat 3]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+import docutils.frontend
+import docutils.nodes
+import docutils.parsers.rst
+import docutils.utils
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from annotatedocs.document import Document  # noqa
+from annotatedocs.metrics import NodeType  # noqa
+
+
+# Number of nodes that ``make_section`` creates.
+NODES_PER_SECTION = 33
+
+
+def make_section(number):
+    section = docutils.nodes.section()
+    section += docutils.nodes.title(text=u'Section {}'.format(number))
+    for i in range(10):
+        section += docutils.nodes.paragraph(
+            text=u'Paragraph {} in section {}.'.format(i, number))
+    bullet_list = docutils.nodes.bullet_list()
+    for i in range(3):
+        list_item = docutils.nodes.list_item()
+        list_item += docutils.nodes.paragraph(text=u'Item {}.'.format(i))
+        bullet_list += list_item
+    section += bullet_list
+    return section
+
+
+def make_doctree(node_count):
+    settings = docutils.frontend.OptionParser(
+        components=(docutils.parsers.rst.Parser,)
+    ).get_default_values()
+    doctree = docutils.utils.new_document('<benchmark>', settings)
+    for number in range(max(1, node_count // NODES_PER_SECTION)):
+        doctree += make_section(number)
+    return doctree
+
+
+def make_document(node_count):
+    document = Document(make_doctree(node_count), bundle=None, name='bench')
+    document.apply_metric(NodeType)
+    return document
+
+
+def legacy_filter_nodes(nodes, check):
+    """
+    The list based deduplication that ``NodeSet._filter_nodes`` used before.
+    It is kept here as a reference point for the benchmark.
+    """
+    found = []
+    to_check = nodes[:]
+    while to_check:
+        current_node = to_check.pop()
+        if check(current_node):
+            if current_node not in found:
+                found.append(current_node)
+                yield current_node
+        to_check.extend(reversed(current_node.children))
+
+
+def measure(func, repeat):
+    timings = []
+    for i in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def report(name, node_count, seconds):
+    print('{name:<48} {nodes:>7} nodes {ms:>10.1f} ms'.format(
+        name=name, nodes=node_count, ms=seconds * 1000))
+
+
+def run(node_count, repeat):
+    document = make_document(node_count)
+    node_count = len(list(document.iter_nodes()))
+    nodeset = document.nodeset
+
+    def match_all(node):
+        return True
+
+    def is_paragraph(node):
+        return node['type'] == 'paragraph'
+
+    sections = list(nodeset.filter(type='section'))
+    middle = sections[len(sections) // 2]
+
+    benchmarks = [
+        ('filter(<match all>)',
+         lambda: nodeset.filter(match_all).count()),
+        ('filter(<is paragraph>)',
+         lambda: nodeset.filter(is_paragraph).count()),
+        ('filter(type=paragraph)',
+         lambda: nodeset.filter(type='paragraph').count()),
+        ('filter(is_content_type=True)',
+         lambda: nodeset.filter(is_content_type=True).count()),
+        ('filter(is_content_type=True, type__contains=ar)',
+         lambda: nodeset.filter(is_content_type=True,
+                                type__contains='ar').count()),
+        ('<each section>.nodeset.filter(type=paragraph)',
+         lambda: sum(section.nodeset.filter(type='paragraph').count()
+                     for section in sections)),
+        ('before(<middle section>).filter(type=paragraph)',
+         lambda: nodeset.before(middle).filter(type='paragraph').count()),
+    ]
+    for name, func in benchmarks:
+        report(name, node_count, measure(func, repeat))
+
+    return document
+
+
+def run_legacy(node_count, repeat):
+    document = make_document(node_count)
+    node_count = len(list(document.iter_nodes()))
+    roots = document.nodeset.root_nodes
+
+    def match_all(node):
+        return True
+
+    report(
+        'legacy list dedup, filter(<match all>)',
+        node_count,
+        measure(lambda: list(legacy_filter_nodes(roots, match_all)), repeat))
+    report(
+        'filter(<match all>)',
+        node_count,
+        measure(lambda: document.nodeset.filter(match_all).count(), repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--nodes', type=int, default=50000)
+    parser.add_argument('--legacy-nodes', type=int, default=2000,
+                        help=(
+                            'Size of the tree that is used to compare against '
+                            'the former quadratic deduplication.'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    run(args.nodes, args.repeat)
+    if args.legacy_nodes:
+        print()
+        run_legacy(args.legacy_nodes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
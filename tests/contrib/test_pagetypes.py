@@ -1,6 +1,13 @@
+import docutils.nodes
+from sphinx import addnodes
+
+from annotatedocs import Bundle
 from annotatedocs.contrib.pagetypes.contribution_guide import ContributionGuide
+from annotatedocs.contrib.pagetypes.homepage import Homepage, TocPosition
+from annotatedocs.document import Document
 from annotatedocs.contrib.pagetypes.installation_guide import InstallationGuide
 from . import named_document as d
+from ..parse import parse_rst
 
 
 class TestInstallationGuide(object):
@@ -32,3 +39,113 @@ class TestContributionGuide(object):
         assert pagetype.match(d('contributors')) == 0
         assert pagetype.match(d('contributers')) == 0
         assert pagetype.match(d('contributed')) == 0
+
+
+class TestHomepage(object):
+    def test_filename_matches(self):
+        pagetype = Homepage()
+
+        assert pagetype.match(d('index')) == 1
+        assert pagetype.match(d('index_de')) == 0.8
+        assert pagetype.match(d('indexpage')) == 0.8
+
+        assert pagetype.match(d('intro/index')) == 0
+        assert pagetype.match(d('installation')) == 0
+
+
+class TestPathScores(object):
+    def test_scores_equal_matches(self):
+        page_types = [Homepage(), InstallationGuide(), ContributionGuide()]
+        bundle = Bundle(*page_types)
+        names = [
+            'index', 'index_de', 'intro/installation_guide', 'installer',
+            'howto/contribute', 'contributors', 'api/01_A', 'to/sh/or/t']
+
+        scores = bundle.get_path_scores(names)
+
+        assert sorted(scores) == sorted(names)
+        for name in names:
+            assert scores[name] == dict(
+                (page_type, page_type.match(d(name)))
+                for page_type in page_types)
+
+    def test_content_page_types_are_not_classified(self):
+        class ContentPage(Homepage):
+            def match(self, document):
+                return 1
+
+        page_type = ContentPage()
+        bundle = Bundle(page_type, Homepage)
+
+        assert not page_type.matches_path_only()
+        assert page_type not in bundle.get_path_scores(['index'])['index']
+
+
+class TestTocPosition(object):
+    def test_flags(self):
+        document = Document(parse_rst("""
+Introduction.
+
+.. compound::
+    :class: toctree-wrapper
+
+    * Entry
+
+Outro.
+"""), bundle=None, name='index')
+        document.apply_metric(TocPosition)
+
+        flags = [
+            (node.class_name, node['before_toc'], node['part_of_toc'], node['after_toc'])
+            for node in document.iter_nodes()
+            if node.class_name in ('paragraph', 'compound')]
+        assert flags == [
+            ('paragraph', True, False, False),
+            ('compound', False, True, False),
+            ('paragraph', False, True, False),
+            ('paragraph', False, False, True),
+        ]
+
+    def test_flags_of_homepage_with_toctree(self):
+        # Mirrors the doctree that Sphinx creates for the sample homepage:
+        # the toctree node is wrapped in a compound with the
+        # ``toctree-wrapper`` class.
+        node = parse_rst("""
+Homepage
+========
+
+Contents:
+
+.. compound::
+    :class: toctree-wrapper
+
+    Placeholder.
+
+Here comes a longer paragraph **after** the table of contents.
+
+Indices and tables
+==================
+
+* Index
+""")
+        wrapper = next(iter(node.traverse(docutils.nodes.compound)))
+        wrapper[:] = [addnodes.toctree(entries=[(None, 'installation')])]
+        document = Document(node, bundle=None, name='index')
+        document.apply_metrics([TocPosition])
+
+        flags = [
+            (node.class_name, node['before_toc'], node['part_of_toc'],
+             node['after_toc'])
+            for node in document.iter_nodes()
+            if node.class_name in (
+                'title', 'paragraph', 'compound', 'toctree', 'list_item')]
+        assert flags == [
+            ('title', True, False, False),
+            ('paragraph', True, False, False),
+            ('compound', False, True, False),
+            ('toctree', False, True, False),
+            ('paragraph', False, False, True),
+            ('title', False, False, True),
+            ('list_item', False, False, True),
+            ('paragraph', False, False, True),
+        ]
@@ -0,0 +1,33 @@
+from annotatedocs.cache import ResultCache, hash_text
+
+
+class TestResultCache(object):
+    def test_get_and_set(self, tmpdir):
+        path = str(tmpdir.join('cache.sqlite'))
+        cache = ResultCache(path)
+        text_hash = hash_text(u'Some text.')
+
+        assert cache.get_many('metric', '1', [text_hash]) == {}
+        cache.set_many('metric', '1', {text_hash: [(u'Some', 'DT')]})
+        assert cache.get_many('metric', '1', [text_hash]) == {
+            text_hash: [(u'Some', 'DT')]}
+        assert cache.get_many('metric', '2', [text_hash]) == {}
+        assert cache.get_many('other', '1', [text_hash]) == {}
+        cache.close()
+
+        cache = ResultCache(path)
+        assert cache.get_many('metric', '1', [text_hash]) == {
+            text_hash: [(u'Some', 'DT')]}
+        cache.close()
+
+    def test_least_recently_used_results_are_evicted(self, tmpdir):
+        cache = ResultCache(str(tmpdir.join('cache.sqlite')))
+        cache.set_many('metric', '1', {'a': 'x' * 100, 'b': 'x' * 100})
+        cache.max_size = cache.get_size()
+
+        cache.get_many('metric', '1', ['a'])
+        cache.set_many('metric', '1', {'c': 'x' * 100})
+        assert sorted(cache.get_many('metric', '1', ['a', 'b', 'c'])) == [
+            'a', 'c']
+        assert cache.get_size() <= cache.max_size
+        cache.close()
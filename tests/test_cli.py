@@ -1,10 +1,18 @@
+import json
 import os
+import re
 import shutil
 import traceback
 
 from click.testing import CliRunner
+import pytest
 
+from annotatedocs.builder import AnnotatedHTMLBuilder
 from annotatedocs.cli import main
+from annotatedocs.messages import MessageTable
+
+
+ANNOTATIONS_RE = re.compile(r'data-(?:document-)?annotations="([^"]*)"')
 
 
 def get_sampledocs_dir():
@@ -23,14 +31,59 @@ class AnnotatedocsCliRunner(CliRunner):
         }
 
 
-def test_build_of_sampledocs():
+def get_annotations(build_dir):
+    """
+    Return the annotations of every page in the build, with the references
+    into the message table resolved, and the global annotations.
+    """
+    table_path = os.path.join(
+        build_dir, AnnotatedHTMLBuilder.message_table_filename)
+    with open(table_path) as f:
+        content = f.read()
+    table = json.loads(
+        content[len(MessageTable.prefix):-len(MessageTable.suffix)])
+
+    def resolve(refs):
+        return [table['messages'][ref] for ref in refs]
+
+    pages = {}
+    for directory, dirnames, filenames in os.walk(build_dir):
+        for filename in filenames:
+            if not filename.endswith('.html'):
+                continue
+            path = os.path.join(directory, filename)
+            with open(path) as f:
+                pages[os.path.relpath(path, build_dir)] = [
+                    resolve(json.loads(refs))
+                    for refs in ANNOTATIONS_RE.findall(f.read())]
+    return pages, resolve(table['global'])
+
+
+def build(runner, docs, name, args=()):
+    result = runner.invoke(main, [
+        docs['root'],
+        '--build-dir', name,
+        '--tmp-dir', name + '-tmp',
+    ] + list(args))
+
+    if result.exit_code != 0:
+        lines = traceback.format_exception(*result.exc_info)
+        assert result.exit_code == 0, ''.join(lines)
+    return name
+
+
+@pytest.mark.parametrize('args', [
+    [],
+    ['--jobs', '2'],
+    ['--streaming'],
+])
+def test_build_of_sampledocs(args):
     runner = AnnotatedocsCliRunner()
     with runner.isolated_filesystem():
         docs = runner.prepare_docs()
-        result = runner.invoke(main, [
-            docs['root']
-        ])
-
-        if result.exit_code != 0:
-            lines = traceback.format_exception(*result.exc_info)
-            assert result.exit_code == 0, ''.join(lines)
+        build_dir = build(runner, docs, 'build', args)
+        if args:
+            # The annotations must be the same as the ones of a serial
+            # build, only the references into the message table may differ.
+            serial_dir = build(runner, docs, 'serial')
+            assert get_annotations(build_dir) == get_annotations(serial_dir)
@@ -0,0 +1,439 @@
+import docutils.nodes
+import pytest
+
+from annotatedocs import Bundle, Check, Metric, PageType, TextMetric, metrics
+from annotatedocs.cache import ResultCache
+from annotatedocs.document import (
+    DenseColumn, Document, DocumentStructure, NodeData)
+from annotatedocs.nodeset import NodeMatcher
+
+from .parse import parse_rst
+
+
+SOURCE = """
+Title
+=====
+
+Same text.
+
+Same text.
+
+* Item
+"""
+
+
+def make_document(source=SOURCE):
+    return Document(parse_rst(source), bundle=None, name='test')
+
+
+class TestDocumentData(object):
+    def test_node_ids_are_assigned_in_document_order(self):
+        document = make_document()
+        data = document.data
+
+        assert data.nodes[0] is document.node
+        assert data.get_parent_id(0) is None
+        assert [node.node_id for node in document.iter_nodes()] == range(len(data))
+        for node_id, node in enumerate(data.nodes[1:], 1):
+            assert data.nodes[data.get_parent_id(node_id)] is node.parent
+
+    def test_subtree_ends(self):
+        document = make_document()
+        data = document.data
+
+        assert data.get_subtree_end(0) == len(data)
+        for node_id, node in enumerate(data.nodes):
+            descendants = [
+                data.get_node_id(descendant)
+                for descendant in node.traverse(include_self=False)]
+            end = data.get_subtree_end(node_id)
+            assert descendants == range(node_id + 1, end)
+            assert (
+                [data.nodes[child_id] for child_id in data.iter_child_ids(node_id)] ==
+                list(node.children))
+
+    def test_text_nodes_with_same_content_have_own_data(self):
+        document = make_document()
+        paragraphs = [
+            node for node in document.data.nodes
+            if node.__class__.__name__ == 'paragraph'][:2]
+        first, second = [document[paragraph[0]] for paragraph in paragraphs]
+
+        assert first.node == second.node
+        assert first != second
+        first['foo'] = 1
+        assert 'foo' not in second
+
+    def test_columns_are_sparse_until_most_nodes_have_a_value(self):
+        document = make_document()
+        data = document.data
+
+        document[document.node]['key'] = 'value'
+        assert type(data.columns['key']) is dict
+
+        for node in document.iter_nodes():
+            node['key'] = node.node_id
+        column = data.columns['key']
+        assert isinstance(column, DenseColumn)
+        assert len(column) == len(data)
+        assert [node['key'] for node in document.iter_nodes()] == range(len(data))
+
+        del document[document.node]['key']
+        assert len(column) == len(data) - 1
+        assert 'key' not in document[document.node]
+
+    def test_texts_match_docutils(self):
+        document = make_document()
+
+        for node in document.iter_nodes():
+            assert node.astext() == node.node.astext()
+
+    def test_changed_subtree_invalidates_texts(self):
+        document = make_document()
+        root = document[document.node]
+        paragraph = document.nodeset.filter(
+            lambda node: node.class_name == 'paragraph').first()
+        assert paragraph.astext() == u'Same text.'
+
+        paragraph.node[0] = docutils.nodes.Text(u'Changed.')
+        assert paragraph.astext() == u'Same text.'
+        paragraph.invalidate_text()
+        assert paragraph.astext() == u'Changed.'
+        assert root.astext() == document.node.astext()
+
+        # Registering a new node invalidates the texts of its ancestors.
+        new_text = docutils.nodes.Text(u' More.')
+        paragraph.node.append(new_text)
+        assert document[new_text].astext() == u' More.'
+        assert paragraph.astext() == u'Changed. More.'
+        assert root.astext() == document.node.astext()
+
+
+class TestNodeData(object):
+    def test_is_a_view(self):
+        document = make_document()
+        node = document[document.node]
+
+        assert isinstance(node, NodeData)
+        assert not hasattr(node, '__dict__')
+        assert document[document.node] == node
+        assert document[document.node] is not node
+        assert hash(document[document.node]) == hash(node)
+        assert node.children[0].parent == node
+
+    def test_mapping_interface(self):
+        document = make_document()
+        node = document[document.node]
+
+        assert node.get('foo') is None
+        assert node.get('foo', 1) == 1
+        with pytest.raises(KeyError):
+            node['foo']
+
+        assert node.setdefault('foo', []) == []
+        node.append('foo', 1)
+        assert document[document.node]['foo'] == [1]
+
+        node.update(bar=2)
+        assert sorted(node.keys()) == ['bar', 'foo']
+        assert sorted(node.items()) == [('bar', 2), ('foo', [1])]
+        assert len(node) == 2
+
+        assert node.pop('bar') == 2
+        assert node.pop('bar', None) is None
+        with pytest.raises(KeyError):
+            node.pop('bar')
+        assert dict(node) == {'foo': [1]}
+
+    def test_positions(self):
+        document = make_document()
+        nodes = list(document.iter_nodes())
+        section, title, first_paragraph = nodes[1], nodes[2], nodes[4]
+        text = nodes[5]
+
+        assert text.is_within(first_paragraph)
+        assert text.is_descendant_of(first_paragraph)
+        assert first_paragraph.is_within(first_paragraph)
+        assert not first_paragraph.is_descendant_of(first_paragraph)
+        assert not first_paragraph.is_within(text)
+
+        assert title.is_before(first_paragraph)
+        assert not section.is_before(first_paragraph)
+        assert not first_paragraph.is_before(text)
+        assert text.is_after(title)
+        assert not text.is_after(first_paragraph)
+        assert not title.is_after(text)
+
+
+class BatchMetric(Metric):
+    batches = []
+
+    def apply_to_documents(self, documents):
+        self.batches.append([document.name for document in documents])
+        for document in documents:
+            document[document.node]['batched'] = True
+
+
+@metrics.require(BatchMetric)
+class BatchCheck(Check):
+    def check(self, nodeset, document):
+        assert nodeset.first()['batched']
+
+
+class AnyPage(PageType):
+    checks = [BatchCheck]
+
+    def match(self, document):
+        return 1
+
+
+class FailingCheck(Check):
+    def check(self, nodeset, document):
+        assert document.structure.map(count_words, ['a b', 'c']) == [2, 1]
+        raise RuntimeError('Check failed')
+
+
+class FailingPage(PageType):
+    checks = [FailingCheck]
+
+    def match(self, document):
+        return 1
+
+
+def count_words(text):
+    return len(text.split())
+
+
+class WordCount(TextMetric):
+    compute = staticmethod(count_words)
+    cache_version = '1'
+
+    def store(self, node, word_count):
+        node['word_count'] = word_count
+
+
+class TestDocumentStructure(object):
+    def test_metrics_are_applied_in_one_batch(self):
+        BatchMetric.batches = []
+        structure = DocumentStructure(
+            {
+                'first': parse_rst(SOURCE),
+                'second': parse_rst(SOURCE),
+            },
+            bundle=Bundle(AnyPage))
+        structure.analyze()
+
+        assert len(BatchMetric.batches) == 1
+        assert sorted(BatchMetric.batches[0]) == ['first', 'second']
+        for document in structure.documents.values():
+            assert document.is_analyzed
+            assert BatchMetric().get_id() in document.applied_metrics
+
+    def test_text_metric_in_worker_processes(self):
+        documents = dict(
+            (name, parse_rst(SOURCE))
+            for name in ('first', 'second', 'third'))
+        serial = DocumentStructure(documents, bundle=None)
+        parallel = DocumentStructure(documents, bundle=None, jobs=2)
+        for structure in (serial, parallel):
+            structure.apply_metric(WordCount, structure.documents.values())
+            structure.close_pool()
+
+        for name in documents:
+            assert (
+                [node.get('word_count') for node in serial.get_document(name).iter_nodes()] ==
+                [node.get('word_count') for node in parallel.get_document(name).iter_nodes()])
+        assert serial.get_document('first')[documents['first']]['word_count'] == 6
+        assert parallel.map(count_words, ['a b', 'c']) == [2, 1]
+        parallel.close_pool()
+
+    def test_pool_is_closed_when_a_check_fails(self):
+        structure = DocumentStructure(
+            {'first': parse_rst(SOURCE)}, bundle=Bundle(FailingPage), jobs=2)
+        with pytest.raises(RuntimeError):
+            structure.analyze()
+        assert structure._pool is None
+
+    def test_text_metric_results_are_cached(self, tmpdir):
+        cache = ResultCache(str(tmpdir.join('cache.sqlite')))
+        structure = DocumentStructure(
+            {'first': parse_rst(SOURCE)}, bundle=None, cache=cache)
+        structure.apply_metric(WordCount, structure.documents.values())
+        first = structure.get_document('first')
+
+        computed = []
+
+        def compute(text):
+            computed.append(text)
+            return count_words(text)
+
+        metric = WordCount()
+        metric.compute = compute
+        texts = [node.node.astext() for node in first.iter_nodes()]
+        assert metric.compute_all(texts + [u'New text'], structure) == (
+            [node['word_count'] for node in first.iter_nodes()] + [2])
+        assert computed == [u'New text']
+        cache.close()
+
+    def test_text_metric_computes_repeated_texts_once(self):
+        computed = []
+
+        def compute(text):
+            computed.append(text)
+            return count_words(text)
+
+        metric = WordCount()
+        metric.compute = compute
+        texts = [u'a b', u'c', u'a b']
+        assert metric.compute_all(texts) == [2, 1, 2]
+        assert sorted(computed) == [u'a b', u'c']
+
+
+class CountingMetric(Metric):
+    def __init__(self):
+        self.applied = []
+
+    def apply(self, node, document):
+        self.applied.append(node.node_id)
+        node[self.get_id()] = True
+
+
+class ListItems(CountingMetric):
+    def limit(self, nodeset):
+        return nodeset.filter(type='list_item')
+
+
+class Paragraphs(CountingMetric):
+    def limit(self, nodeset):
+        return nodeset.filter(type='paragraph')
+
+
+class Everything(CountingMetric):
+    pass
+
+
+class TestFusedMetrics(object):
+    def test_fused_metrics_match_separate_application(self):
+        fused = make_document()
+        fused.apply_metric(metrics.NodeType)
+        fused_instances = [ListItems(), Paragraphs(), Everything()]
+        fused.apply_fused_metrics(fused_instances)
+
+        separate = make_document()
+        separate.apply_metric(metrics.NodeType)
+        separate_instances = [ListItems(), Paragraphs(), Everything()]
+        for instance in separate_instances:
+            instance.apply_to_document(separate)
+
+        for fused_instance, separate_instance in zip(
+                fused_instances, separate_instances):
+            assert fused_instance.applied == separate_instance.applied
+        assert (
+            [sorted(node.items()) for node in fused.iter_nodes()] ==
+            [sorted(node.items()) for node in separate.iter_nodes()])
+
+    def test_only_candidates_are_visited(self, monkeypatch):
+        document = make_document()
+        document.apply_metric(metrics.NodeType)
+
+        visited = []
+        match = NodeMatcher.match.im_func
+
+        def counting_match(self, document_data, node_id):
+            visited.append(node_id)
+            return match(self, document_data, node_id)
+        monkeypatch.setattr(NodeMatcher, 'match', counting_match)
+
+        document.apply_fused_metrics([ListItems(), Paragraphs()])
+        candidates = (
+            document.index.lookup_ids('type', 'list_item') +
+            document.index.lookup_ids('type', 'paragraph'))
+        assert sorted(set(visited)) == sorted(candidates)
+
+    def test_can_be_fused(self):
+        assert Everything().can_be_fused()
+        assert not BatchMetric().can_be_fused()
+        assert not WordCount().can_be_fused()
+
+
+class LazyMetric(CountingMetric):
+    provides = ('lazy',)
+
+    def apply(self, node, document):
+        super(LazyMetric, self).apply(node, document)
+        node['lazy'] = node.node_id
+
+
+class AccumulatingMetric(Metric):
+    provides = ('acc',)
+
+    def apply(self, node, document):
+        node.setdefault('acc', []).append(1)
+
+
+class TestLazyMetrics(object):
+    def test_metric_is_applied_on_first_access(self):
+        document = make_document()
+        document.require_metrics([LazyMetric])
+        assert LazyMetric().get_id() not in document.applied_metrics
+
+        node = document[document.node]
+        assert node['lazy'] == 0
+        assert LazyMetric().get_id() in document.applied_metrics
+        assert document.data.pending_keys == {}
+
+    def test_metric_is_applied_on_filter(self):
+        document = make_document()
+        document.require_metrics([LazyMetric, metrics.NodeType])
+        assert document.nodeset.filter(lazy=1).count() == 1
+        assert 'type' in document.data.pending_keys
+        assert document.nodeset.filter(type='paragraph').count() == 3
+        assert document.data.pending_keys == {}
+
+    def test_pending_metric_is_applied_once_when_applied_eagerly(self):
+        document = make_document()
+        document.require_metrics([AccumulatingMetric])
+        document.apply_metrics([AccumulatingMetric])
+
+        assert document.data.pending_keys == {}
+        assert all(
+            node['acc'] == [1]
+            for node in document.nodeset.filter(acc__exists=True))
+        assert document[document.node]['acc'] == [1]
+
+    def test_node_attributes_apply_node_type(self):
+        document = make_document()
+        document.require_metrics([metrics.NodeType])
+        for attribute in metrics.NodeType.attributes:
+            assert attribute in document.data.pending_keys
+
+        document.nodeset.filter(language__exists=True).count()
+        assert metrics.NodeType().get_id() in document.applied_metrics
+
+    def test_metrics_without_keys_are_applied_right_away(self):
+        document = make_document()
+        document.require_metrics([Everything])
+        assert Everything().get_id() in document.applied_metrics
+
+    def test_name_based_match_does_not_apply_metrics(self):
+        @metrics.require(LazyMetric)
+        class NamedPage(PageType):
+            checks = []
+
+            def match(self, document):
+                return int(document.name == 'other')
+
+        @metrics.require(LazyMetric)
+        class LookingPage(PageType):
+            checks = []
+
+            def match(self, document):
+                return int(document.nodeset.filter(lazy__exists=True).exists())
+
+        document = make_document()
+        Bundle(NamedPage).determine_page_types(document)
+        assert LazyMetric().get_id() not in document.applied_metrics
+
+        page_types = Bundle(LookingPage).determine_page_types(document)
+        assert len(page_types) == 1
+        assert LazyMetric().get_id() in document.applied_metrics
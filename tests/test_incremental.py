@@ -0,0 +1,106 @@
+from annotatedocs import Bundle, Check, Hint, PageType, metrics
+from annotatedocs.document import DocumentStructure
+from annotatedocs.incremental import AnalysisStore
+
+from .parse import parse_rst
+
+
+SOURCE = """
+Title
+=====
+
+A paragraph.
+
+Another paragraph.
+"""
+
+
+@metrics.require(metrics.NodeType)
+class ParagraphCheck(Check):
+    def check(self, nodeset, document):
+        for node in nodeset.filter(type='paragraph'):
+            node.annotate(Hint(u'Paragraph {node.node_id}').format(node=node))
+        document.structure.annotate(Hint(u'Checked {{braces}}'))
+
+
+class AnyPage(PageType):
+    checks = [ParagraphCheck]
+
+    def match(self, document):
+        return 1
+
+
+bundle = Bundle(AnyPage)
+
+
+def analyzed_structure():
+    structure = DocumentStructure({'index': parse_rst(SOURCE)}, bundle=bundle)
+    structure.analyze()
+    return structure
+
+
+def serialized_annotations(document):
+    return [
+        (node.node_id, [annotation.serialize() for annotation in node.annotations])
+        for node in document.iter_nodes()
+        if node.annotations]
+
+
+class TestAnalysisStore(object):
+    def test_restore_document(self, tmpdir):
+        path = str(tmpdir.join('analysis.pickle'))
+        document = analyzed_structure().get_document('index')
+        assert len(document.global_annotations) == 1
+
+        store = AnalysisStore(path, fingerprint='1')
+        assert not store.is_fresh
+        store.add_document(document)
+        store.save()
+
+        store = AnalysisStore(path, fingerprint='1')
+        assert store.is_fresh
+        assert [
+            annotation.serialize()
+            for annotation in store.get_global_annotations()] == [
+            {'message': u'Checked {braces}', 'level': 'hint'}]
+
+        restored = DocumentStructure(
+            {'index': parse_rst(SOURCE)},
+            bundle=bundle).get_document('index')
+        assert store.restore_document(restored)
+        assert restored.is_analyzed
+        assert restored.page_types == document.page_types
+        assert len(restored.applied_checks) == 1
+        assert serialized_annotations(restored) == serialized_annotations(document)
+
+    def test_fingerprint_change_drops_records(self, tmpdir):
+        path = str(tmpdir.join('analysis.pickle'))
+        store = AnalysisStore(path, fingerprint='1')
+        store.add_document(analyzed_structure().get_document('index'))
+        store.save()
+
+        store = AnalysisStore(path, fingerprint='2')
+        assert not store.is_fresh
+        assert store.records == {}
+
+    def test_changed_document_is_not_restored(self, tmpdir):
+        store = AnalysisStore(str(tmpdir.join('analysis.pickle')), fingerprint='1')
+        store.add_document(analyzed_structure().get_document('index'))
+
+        changed = DocumentStructure(
+            {'index': parse_rst(SOURCE + '\nOne more.\n')},
+            bundle=bundle).get_document('index')
+        assert not store.restore_document(changed)
+        assert not changed.is_analyzed
+
+    def test_in_memory_store(self):
+        store = AnalysisStore()
+        assert not store.is_fresh
+        store.add_document(analyzed_structure().get_document('index'))
+        store.save()
+
+        restored = DocumentStructure(
+            {'index': parse_rst(SOURCE)},
+            bundle=bundle).get_document('index')
+        assert store.restore_document(restored)
+        assert len(store.get_global_annotations()) == 1
@@ -0,0 +1,56 @@
+from annotatedocs.messages import MessageTable
+
+
+def message(text, level='hint', title=None):
+    data = {'message': text, 'level': level}
+    if title is not None:
+        data['title'] = title
+    return data
+
+
+class TestMessageTable(object):
+    def test_equal_messages_are_stored_once(self):
+        table = MessageTable()
+
+        assert table.add_data(message('Too long')) == 0
+        assert table.add_data(message('Too short')) == 1
+        assert table.add_data(message('Too long')) == 0
+        assert table.add_data(message('Too long', level='warning')) == 2
+        assert table.add_data(message('Too long', title='Length')) == 3
+        assert len(table.messages) == 4
+
+    def test_dump_refs(self):
+        class Annotation(object):
+            def __init__(self, text):
+                self.text = text
+
+            def serialize(self):
+                return message(self.text)
+
+        table = MessageTable([message('Too long')])
+
+        assert table.dump_refs([]) is None
+        assert table.dump_refs([
+            Annotation('Too short'),
+            Annotation('Too long'),
+            Annotation('Too short'),
+        ]) == '[1,0,1]'
+
+    def test_save_and_load(self, tmpdir):
+        path = str(tmpdir.join('_static', 'annotations.js'))
+        table = MessageTable([message('Too long'), message('Too short')])
+        table.global_refs = [1]
+        table.save(path)
+
+        loaded = MessageTable.load(path)
+        assert loaded.messages == table.messages
+        # Refs stay stable, new messages are appended.
+        assert loaded.add_data(message('Too short')) == 1
+        assert loaded.add_data(message('Missing title')) == 2
+
+    def test_load_missing_or_broken_table(self, tmpdir):
+        assert MessageTable.load(str(tmpdir.join('missing.js'))).messages == []
+
+        broken = tmpdir.join('broken.js')
+        broken.write('var foo = 1;')
+        assert MessageTable.load(str(broken)).messages == []
@@ -1,4 +1,24 @@
+import pytest
+
 from annotatedocs import metrics
+from annotatedocs.contrib.metrics.sectiontitle import (
+    SectionTitleContainsKeywords)
+from annotatedocs.contrib.pagetypes.contribution_guide import (
+    ReportIssueSection)
+from annotatedocs.document import Document
+
+from .parse import parse_rst
+
+
+SOURCE = """
+Title
+=====
+
+Section
+-------
+
+Text.
+"""
 
 
 def test_require():
@@ -10,3 +30,89 @@ def test_require():
         pass
 
     assert Dependent.get_required_metrics() == [Dependency]
+
+
+class TestMetricGraph(object):
+    def test_levels(self):
+        class Base(metrics.Metric):
+            pass
+
+        @metrics.require(Base)
+        class Left(metrics.Metric):
+            pass
+
+        @metrics.require(Base)
+        class Right(metrics.Metric):
+            pass
+
+        @metrics.require(Left, Right)
+        class Top(metrics.Metric):
+            pass
+
+        graph = metrics.MetricGraph()
+        assert graph.get_levels([Top]) == [[Base], [Left, Right], [Top]]
+        assert graph.get_order([Right, Base]) == [Base, Right]
+        assert graph.get_levels([]) == []
+
+    def test_metrics_are_deduplicated_by_id(self):
+        class Dependency(metrics.Metric):
+            pass
+
+        @metrics.require(Dependency)
+        class First(metrics.Metric):
+            pass
+
+        @metrics.require(Dependency())
+        class Second(metrics.Metric):
+            pass
+
+        graph = metrics.MetricGraph([First, Second, Second()])
+        assert graph.get_order([First, Second()]) == [Dependency, First, Second]
+
+    def test_metrics_with_different_parameters_are_all_applied(self):
+        class Flag(metrics.Metric):
+            def __init__(self, name, value=True):
+                self.name = name
+                self.value = value
+
+            def limit(self, nodeset):
+                return nodeset.filter(type='section')
+
+            def apply(self, node, document):
+                node[self.name] = self.value
+
+        graph = metrics.MetricGraph()
+        assert graph.get_id(Flag('first')) == graph.get_id(Flag('first'))
+        assert graph.get_id(Flag('first')) != graph.get_id(Flag('second'))
+        assert graph.get_id(Flag('first')) != graph.get_id(
+            Flag('first', value=False))
+
+        document = Document(parse_rst(SOURCE), bundle=None, name='test')
+        document.apply_metrics([
+            metrics.NodeType, Flag('first'), Flag('second', value=False)])
+        section = document.nodeset.filter(type='section').first()
+        assert section['first'] is True
+        assert section['second'] is False
+
+    def test_section_title_keywords_are_part_of_the_id(self):
+        install = SectionTitleContainsKeywords('is_install', ['install'])
+        bugs = SectionTitleContainsKeywords('is_bugs', ['bug'])
+        assert install.get_id() != bugs.get_id()
+        assert install.get_id() == SectionTitleContainsKeywords(
+            keywords=['install'], flag_name='is_install').get_id()
+        assert ReportIssueSection().get_id() != install.get_id()
+
+    def test_circular_dependencies(self):
+        class First(metrics.Metric):
+            pass
+
+        @metrics.require(First)
+        class Second(metrics.Metric):
+            pass
+
+        metrics.require(Second)(First)
+
+        with pytest.raises(metrics.CircularDependencyError):
+            metrics.MetricGraph([Second])
+        with pytest.raises(metrics.CircularDependencyError):
+            First.get_required_metrics()
@@ -1,6 +1,12 @@
+from array import array
+
 import pytest
+from textblob import TextBlob
 
-from annotatedocs.contrib.nlp import get_pos_tags, get_passive_voice_phrases
+from annotatedocs.contrib.metrics.textstats import get_text_stats
+from annotatedocs.contrib.nlp import (
+    TokenizedText, get_pos_tags, get_pos_tags_batch, get_passive_voice_phrases,
+    get_words, pos_tagger)
 
 
 class TestGetPassiveVoicePhrases(object):
@@ -108,3 +114,57 @@ class TestGetPassiveVoicePhrases(object):
         phrases = self.get_phrases(text)
 
         assert len(phrases) == 0
+
+
+class TestGetPosTags(object):
+    def test_batch_matches_textblob(self):
+        texts = [
+            u'The fish was caught by the seagull. It did not like that.',
+            u"Why was the road crossed by the chicken?",
+            u'',
+        ]
+        expected = [
+            list(TextBlob(text, pos_tagger=pos_tagger).tags)
+            for text in texts]
+
+        assert get_pos_tags_batch(texts) == expected
+        assert [get_pos_tags(text) for text in texts] == expected
+
+
+class TestGetWords(object):
+    def test_matches_textblob(self):
+        texts = [
+            u"Let's report the bugs, it's easy. Don't you think so?",
+            u'Install it with "pip install annotatedocs".',
+            u'',
+        ]
+        for text in texts:
+            assert get_words(text) == list(TextBlob(text).words)
+
+
+class TestTokenizedText(object):
+    def get_tokens(self):
+        return TokenizedText(
+            char_count=36,
+            tokens=[u'Let', u"'s", u'go', u'.', u'It', u'is', u'"', u'easy',
+                    u'"', u'.'],
+            sentence_ends=array('l', [4, 10]))
+
+    def test_sentences(self):
+        tokens = self.get_tokens()
+        assert tokens.get_sentences() == [
+            [u'Let', u"'s", u'go', u'.'],
+            [u'It', u'is', u'"', u'easy', u'"', u'.']]
+        assert tokens.get_tagger_input() == u'Let \'s go .\nIt is " easy " .'
+
+    def test_words(self):
+        assert self.get_tokens().get_words() == [
+            u'Let', u"'s", u'go', u'It', u'is', u'easy']
+
+    def test_text_stats(self):
+        assert get_text_stats(self.get_tokens()) == {
+            'char_count': 36,
+            'word_count': 10,
+            'sentence_count': 2,
+            'avg_sentence_length': 5,
+        }
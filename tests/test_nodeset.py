@@ -0,0 +1,395 @@
+import pytest
+
+from annotatedocs.document import Document
+from annotatedocs.metrics import Metric, NodeType, require
+from annotatedocs.nodeset import IdRanges, NodeSet
+
+from .parse import parse_rst
+
+
+SOURCE = """
+Title
+=====
+
+First paragraph.
+
+Section
+-------
+
+Second paragraph with **strong** text.
+
+* A list item paragraph.
+
+Subsection
+~~~~~~~~~~
+
+Third paragraph.
+
+::
+
+    print('code')
+
+Other section
+-------------
+
+Fourth paragraph.
+"""
+
+
+def analyzed_document(source=SOURCE):
+    document = Document(parse_rst(source), bundle=None, name='test')
+    document.apply_metric(NodeType)
+    return document
+
+
+def walked(nodeset, **kwargs):
+    """
+    Return the result of a filter that cannot be resolved from the index.
+    """
+    def matches(node):
+        return all(
+            key in node and node[key] == value
+            for key, value in kwargs.items())
+    return list(nodeset.filter(matches))
+
+
+class TestIndex(object):
+    def test_index_is_built_after_node_type(self):
+        document = analyzed_document()
+
+        assert 'type' in document.index
+        assert 'class_name' in document.index
+        assert 'is_content_type' not in document.index
+
+        paragraphs = document.index.lookup('type', 'paragraph')
+        assert len(paragraphs) == 5
+        assert document.index.lookup('type', 'unknown') == []
+
+    def test_indexed_lookup_matches_tree_walk(self):
+        document = analyzed_document()
+        nodeset = document.nodeset
+
+        for node_type in ('paragraph', 'section', 'title', 'literal_block'):
+            assert (
+                list(nodeset.filter(type=node_type)) ==
+                walked(nodeset, type=node_type))
+
+        sections = nodeset.filter(type='section')
+        for section in sections:
+            assert (
+                list(section.nodeset.filter(type='paragraph')) ==
+                walked(section.nodeset, type='paragraph'))
+
+        subset = sections.subset()
+        assert (
+            list(subset.filter(type='paragraph')) ==
+            walked(subset, type='paragraph'))
+
+    def test_indexed_lookup_only_checks_candidates(self):
+        document = analyzed_document()
+        nodeset = document.nodeset
+
+        counter = CountingFilter(lambda node: True)
+        assert nodeset.filter(counter, type='section').count() == 4
+        assert counter.calls == 4
+
+        counter = CountingFilter(lambda node: True)
+        assert nodeset.filter(counter, class_name='literal_block').count() == 1
+        assert counter.calls == 1
+
+
+@require(NodeType)
+class LowercaseWords(Metric):
+    inverted_keys = ('words',)
+
+    def limit(self, nodeset):
+        return nodeset.filter(type='paragraph')
+
+    def apply(self, node, document):
+        node['words'] = node.node.astext().lower().split()
+
+
+class TestInvertedIndex(object):
+    def test_contains_lookup_matches_tree_walk(self):
+        document = analyzed_document()
+        document.apply_metric(LowercaseWords)
+        nodeset = document.nodeset
+
+        assert document.index.is_inverted('words')
+        assert not document.index.is_inverted('type')
+        for word in ('paragraph', 'second', 'missing'):
+            assert list(nodeset.filter(words__contains=word)) == [
+                node
+                for node in walked(nodeset, type='paragraph')
+                if word in node['words']]
+
+    def test_contains_lookup_only_checks_candidates(self):
+        document = analyzed_document()
+        document.apply_metric(LowercaseWords)
+
+        counter = CountingFilter(lambda node: True)
+        nodeset = document.nodeset.filter(counter, words__contains='third')
+        assert nodeset.count() == 1
+        assert counter.calls == 1
+
+
+class TestFilter(object):
+    def test_overlapping_root_nodes_yield_nodes_once(self):
+        document = analyzed_document()
+        sections = document.nodeset.filter(type='section')
+        # The first section contains all other sections.
+        subset = sections.subset()
+        assert len(subset.root_nodes) == 4
+
+        nodes = list(subset.filter(lambda node: True))
+        assert len(nodes) == len(set(id(node) for node in nodes))
+        assert len(nodes) == len(list(document.iter_nodes())) - 1
+
+
+class CountingFilter(object):
+    def __init__(self, test):
+        self.test = test
+        self.calls = 0
+
+    def __call__(self, node):
+        self.calls += 1
+        return self.test(node)
+
+
+def is_paragraph(node):
+    return node['type'] == 'paragraph'
+
+
+class TestEvaluation(object):
+    def test_exists_stops_at_first_match(self):
+        document = analyzed_document()
+        counter = CountingFilter(is_paragraph)
+        nodeset = document.nodeset.filter(counter)
+
+        assert nodeset.exists()
+        first_calls = counter.calls
+        assert first_calls < len(list(document.iter_nodes()))
+
+        assert not document.nodeset.filter(lambda node: False).exists()
+
+    def test_first_and_last(self):
+        document = analyzed_document()
+        paragraphs = list(document.nodeset.filter(is_paragraph))
+
+        assert document.nodeset.filter(is_paragraph).first() == paragraphs[0]
+        assert document.nodeset.filter(is_paragraph).last() == paragraphs[-1]
+        assert document.nodeset.filter(type='paragraph').last() == paragraphs[-1]
+
+        subset = document.nodeset.filter(type='section').subset()
+        assert subset.filter(is_paragraph).last() == paragraphs[-1]
+
+        empty = document.nodeset.filter(lambda node: False)
+        assert empty.first() is None
+        assert empty.last() is None
+
+    def test_getitem(self):
+        document = analyzed_document()
+        paragraphs = list(document.nodeset.filter(is_paragraph))
+        nodeset = document.nodeset.filter(is_paragraph)
+
+        assert nodeset[0] == paragraphs[0]
+        assert nodeset[2] == paragraphs[2]
+        assert nodeset[-1] == paragraphs[-1]
+        assert nodeset[-2] == paragraphs[-2]
+        assert nodeset[1:3] == paragraphs[1:3]
+        assert nodeset[::2] == paragraphs[::2]
+        with pytest.raises(IndexError):
+            nodeset[len(paragraphs)]
+
+    def test_results_are_cached(self):
+        document = analyzed_document()
+        counter = CountingFilter(is_paragraph)
+        nodeset = document.nodeset.filter(counter)
+
+        assert len(nodeset) == 5
+        calls = counter.calls
+        assert nodeset.count() == 5
+        assert list(nodeset) == list(nodeset)
+        repr(nodeset)
+        assert counter.calls == calls
+
+        # A clone is evaluated again.
+        assert nodeset.all().count() == 5
+        assert counter.calls == calls * 2
+
+
+class TestAxes(object):
+    def get_sections(self, document):
+        return list(document.nodeset.filter(type='section'))
+
+    def test_children(self):
+        document = analyzed_document()
+        section = self.get_sections(document)[1]
+
+        children = section.nodeset.children()
+        assert list(children) == section.children
+        assert [node['type'] for node in children.filter(type='paragraph')] == ['paragraph']
+        assert children.filter(type='title').first() == section.children[0]
+
+    def test_descendants(self):
+        document = analyzed_document()
+        section = self.get_sections(document)[1]
+
+        descendants = list(section.nodeset.descendants())
+        assert descendants == list(section.nodeset)[1:]
+        assert (
+            list(section.nodeset.descendants().filter(type='section')) ==
+            [self.get_sections(document)[2]])
+        assert (
+            list(section.nodeset.descendants().filter(type='paragraph')) ==
+            list(section.nodeset.filter(type='paragraph')))
+
+    def test_parent_and_ancestors(self):
+        document = analyzed_document()
+        sections = self.get_sections(document)
+        paragraph = sections[2].nodeset.filter(type='paragraph').first()
+
+        assert list(paragraph.nodeset.parent()) == [sections[2]]
+        assert list(paragraph.nodeset.ancestors()) == [
+            document[document.node],
+            sections[0],
+            sections[1],
+            sections[2]]
+        assert list(paragraph.nodeset.ancestors().filter(type='section')) == sections[:3]
+        assert document.nodeset.parent().first() is None
+
+    def test_axis_can_only_be_set_once(self):
+        document = analyzed_document()
+        with pytest.raises(TypeError):
+            document.nodeset.children().children()
+        grandchildren = document.nodeset.children().subset().children()
+        assert grandchildren.filter(type='title').exists()
+
+
+class TestFilterPlan(object):
+    def test_lookups(self):
+        document = analyzed_document()
+        nodeset = document.nodeset
+
+        assert nodeset.filter(type='paragraph', is_content_type=True).count() == 5
+        assert nodeset.filter(type='section', is_content_type__exists=False).count() == 4
+        assert nodeset.filter(type='section', is_content_type__exists=True).count() == 0
+        assert nodeset.filter(class_name__contains='list').count() == 2
+        assert nodeset.filter(type__gte='title').count() == 4
+        with pytest.raises(TypeError):
+            nodeset.filter(type__unknown='paragraph')
+
+    def test_contradicting_lookups_match_nothing(self, monkeypatch):
+        document = analyzed_document()
+        nodeset = document.nodeset
+
+        def fail(*args, **kwargs):
+            raise AssertionError('The nodes were checked.')
+        monkeypatch.setattr(NodeSet, '_match', fail)
+
+        assert not nodeset.filter(type='section').filter(type='title').exists()
+        assert not nodeset.filter(language__exists=True).filter(
+            language__exists=False).exists()
+        assert not nodeset.filter(
+            is_content_type=True, is_content_type__exists=False).exists()
+
+    def test_merged_lookups(self):
+        document = analyzed_document()
+        nodeset = document.nodeset
+
+        merged = nodeset.filter(type='paragraph').filter(type='paragraph')
+        assert merged.count() == 5
+
+        plan = nodeset.filter(
+            is_content_type=True,
+            is_content_type__exists=True,
+            type__contains='para')._get_plan()
+        assert len(plan.key_checks) == 2
+        assert plan.key_checks[0][0] == 'is_content_type'
+
+    def test_callables_run_after_lookups(self):
+        document = analyzed_document()
+        counter = CountingFilter(lambda node: True)
+
+        nodeset = document.nodeset.filter(counter, is_content_type=True)
+        assert nodeset.count() == 9
+        assert counter.calls == 9
+
+
+class TestPositions(object):
+    def get_sections(self, document):
+        return list(document.nodeset.filter(type='section'))
+
+    def test_within(self):
+        document = analyzed_document()
+        sections = self.get_sections(document)
+
+        assert (
+            list(document.nodeset.within(sections[1])) ==
+            list(sections[1].nodeset))
+        assert (
+            list(document.nodeset.within(sections[1]).filter(type='section')) ==
+            sections[1:3])
+        assert not document.nodeset.within(sections[2]).within(sections[3]).exists()
+
+    def test_before_and_after(self):
+        document = analyzed_document()
+        sections = self.get_sections(document)
+        paragraphs = list(document.nodeset.filter(type='paragraph'))
+
+        # The ancestors of a node are not before it.
+        before = document.nodeset.before(sections[2]).filter(type='section')
+        assert not before.exists()
+        assert list(document.nodeset.before(sections[3]).filter(type='section')) == sections[1:3]
+        assert list(document.nodeset.before(paragraphs[1]).filter(type='paragraph')) == paragraphs[:1]
+        assert document.nodeset.before(paragraphs[1]).last() == sections[1].children[0].children[0]
+
+        assert list(document.nodeset.after(sections[1]).filter(type='paragraph')) == paragraphs[-1:]
+        assert list(document.nodeset.after(sections[2]).filter(type='section')) == sections[3:]
+        assert (
+            list(document.nodeset.after(paragraphs[0]).before(sections[2]).filter(type='paragraph')) ==
+            paragraphs[1:3])
+
+    def test_positions_match_node_data(self):
+        document = analyzed_document()
+        paragraph = document.nodeset.filter(type='paragraph')[2]
+        nodes = list(document.iter_nodes())
+
+        assert list(document.nodeset.before(paragraph)) == [
+            node for node in nodes if node.is_before(paragraph)]
+        assert list(document.nodeset.after(paragraph)) == [
+            node for node in nodes if node.is_after(paragraph)]
+
+    def test_id_ranges(self):
+        ranges = IdRanges()
+        assert ranges.add(5, 10) == [(5, 10)]
+        assert ranges.add(6, 8) == []
+        assert ranges.add(0, 3) == [(0, 3)]
+        assert ranges.add(0, 12) == [(3, 5), (10, 12)]
+        assert ranges.add(4, 4) == []
+        assert ranges.starts == [0]
+        assert ranges.stops == [12]
+
+
+class TestMatcher(object):
+    def test_matcher_matches_evaluation(self):
+        document = analyzed_document()
+        nodes = list(document.iter_nodes())
+        sections = list(document.nodeset.filter(type='section'))
+
+        for nodeset in (
+                document.nodeset.filter(type='paragraph'),
+                document.nodeset.filter(is_paragraph),
+                sections[1].nodeset.filter(is_content_type=True),
+                sections[1].nodeset.descendants(),
+                document.nodeset.after(sections[2])):
+            matcher = nodeset.get_matcher()
+            matched = [
+                node for node in nodes
+                if matcher.match(node.document_data, node.node_id) is not None]
+            assert matched == list(nodeset)
+
+    def test_no_matcher_for_relative_axes(self):
+        document = analyzed_document()
+        assert document.nodeset.children().get_matcher() is None
+        assert document.nodeset.descendants().get_matcher() is not None
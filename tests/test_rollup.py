@@ -0,0 +1,120 @@
+import pytest
+
+from annotatedocs import rollup
+from annotatedocs.document import Document
+from annotatedocs.metrics import NodeType
+
+from .parse import parse_rst
+
+
+SOURCE = """
+Title
+=====
+
+First paragraph.
+
+Section
+-------
+
+Second paragraph with **strong** text.
+
+* A list item paragraph.
+
+Subsection
+~~~~~~~~~~
+
+Third paragraph.
+
+Other section
+-------------
+
+Fourth paragraph.
+"""
+
+
+def make_document():
+    document = Document(parse_rst(SOURCE), bundle=None, name='test')
+    document.apply_metric(NodeType)
+    for node in document.nodeset.filter(type='paragraph'):
+        node['words'] = len(node.astext().split())
+    return document
+
+
+def walked(document, node_id, func, boundaries=()):
+    data = document.data
+    values = [
+        data.get_value(descendant_id, 'words')
+        for descendant_id in range(node_id, data.get_subtree_end(node_id))
+        if 'words' in data.get_node_data(descendant_id) and not any(
+            node_id < boundary <= descendant_id < data.get_subtree_end(boundary)
+            for boundary in boundaries)]
+    if func == 'sum':
+        return sum(values)
+    if func == 'count':
+        return len(values)
+    if not values:
+        return None
+    return {'max': max, 'min': min}[func](values)
+
+
+class TestRollup(object):
+    @pytest.mark.parametrize('func', rollup.ROLLUP_FUNCTIONS)
+    def test_rollup_matches_tree_walk(self, func):
+        document = make_document()
+        data = document.data
+
+        assert data.rollup('words', func) == [
+            walked(document, node_id, func) for node_id in range(len(data))]
+
+    @pytest.mark.parametrize('func', rollup.ROLLUP_FUNCTIONS)
+    def test_boundaries(self, func):
+        document = make_document()
+        data = document.data
+        sections = [
+            section.node_id
+            for section in document.nodeset.filter(type='section')]
+
+        totals = data.rollup('words', func, boundaries=sections)
+        assert totals == [
+            walked(document, node_id, func, sections)
+            for node_id in range(len(data))]
+        if func == 'sum':
+            assert [totals[node_id] for node_id in sections] == [2, 9, 2, 2]
+
+    def test_missing_key(self):
+        document = make_document()
+
+        totals = document.data.rollup('missing')
+        assert totals == [0] * len(document.data)
+        assert all(type(total) is int for total in totals)
+        assert document.data.rollup('missing', 'max') == (
+            [None] * len(document.data))
+
+    def test_unknown_function(self):
+        with pytest.raises(ValueError):
+            make_document().data.rollup('words', 'median')
+
+
+class TestAggregate(object):
+    def test_groups(self):
+        document = make_document()
+        sections = list(document.nodeset.filter(type='section'))
+
+        words = document.nodeset.aggregate('words', 'sum', group_by='section')
+        assert words == dict(zip(sections, [2, 9, 2, 2]))
+
+        list_items = document.nodeset.filter(type='list_item')
+        assert list_items.subset().aggregate('words', 'count') == dict(
+            zip(sections, [0, 1, 0, 0]))
+
+    def test_only_nodes_of_the_nodeset_are_aggregated(self):
+        document = make_document()
+        sections = list(document.nodeset.filter(type='section'))
+        subsection = sections[2]
+
+        words = subsection.nodeset.filter(type='paragraph').aggregate(
+            'words', 'max')
+        assert words == dict(zip(sections, [None, None, 2, None]))
+        assert document.nodeset.aggregate(
+            'words', group_by='bullet_list') == {
+                document.nodeset.filter(type='bullet_list').first(): 4}
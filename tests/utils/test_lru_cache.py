@@ -0,0 +1,22 @@
+from annotatedocs.utils import lru_cache
+
+
+def test_least_recently_used_values_are_dropped():
+    calls = []
+
+    @lru_cache(maxsize=2)
+    def double(value):
+        calls.append(value)
+        return value * 2
+
+    assert double(1) == 2
+    assert double(2) == 4
+    assert double(1) == 2
+    assert calls == [1, 2]
+
+    # Drops the value for 2, which was not used for the longest time.
+    assert double(3) == 6
+    assert double(1) == 2
+    assert double(2) == 4
+    assert calls == [1, 2, 3, 2]
+    assert sorted(double.cache) == [(1,), (2,)]
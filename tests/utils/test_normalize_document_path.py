@@ -31,3 +31,14 @@ def test_remove_short_bits():
 def test_none_result():
     assert normalize_document_path('to/sh/or/t') is None
     assert normalize_document_path('123_!!a32') is None
+
+
+def test_segments():
+    path = normalize_document_path('howtos/01_how_to_rock')
+    assert path.segments == ('howtos', 'how_to_rock')
+    assert normalize_document_path('api/01_A/index').segments == ('api', 'index')
+
+
+def test_memoized():
+    path = normalize_document_path('howtos/01_how_to_rock')
+    assert normalize_document_path('howtos/01_how_to_rock') is path